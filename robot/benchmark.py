@@ -0,0 +1,228 @@
+import argparse
+import json
+import signal
+import time
+from importlib import import_module
+from math import tau, sqrt
+
+import patterns
+
+
+# name: (module, solver), the solver is None for calculators without options
+CALCULATORS = {
+    "stupids-descent": ("smarts_for_stupids", "descent"),
+    "stupids-analytic": ("smarts_for_stupids", "analytic"),
+    "stupids-newton": ("smarts_for_stupids", "newton"),
+    "smarts-descent": ("smarts", "descent"),
+    "smarts-analytic": ("smarts", "analytic"),
+    "smarts-newton": ("smarts", "newton"),
+    "smarts-batch": ("smarts", None),
+    "old-nanomove": ("smarts_old", None),
+    "old-rk45": ("smarts_old", "rk45"),
+}
+
+# Deeper variants of the curves in draw_curve: (name, curve, arguments)
+VARIANTS = [
+    ("HILBERT-5", "HILBERT", (5,)),
+    ("HILBERT-6", "HILBERT", (6,)),
+    ("GOSPER-4", "GOSPER", (4,)),
+    ("GREEK-4", "GREEK", (4,)),
+]
+
+
+class Timeout(Exception):
+    pass
+
+
+def _timeout(signum, frame):
+    raise Timeout()
+
+
+def jobs():
+    # The curves exactly as draw_curve runs them
+    r, alpha = 1, patterns.start_angle
+    result = []
+    for name in patterns.CURVES:
+        moves, scale = patterns.curve(name)
+        result.append((name, list(moves), scale, r, alpha))
+
+    # Higher iterations, scaled to the same size on paper
+    for name, curve, args in VARIANTS:
+        moves, scale = patterns.curve(curve, args, straightness=None)
+        result.append((name, moves, scale, r, alpha))
+
+    return result
+
+
+def position(calculator, module):
+    # Forward kinematics of the pen, in the frame target_B lives in
+    A = module.vecp(calculator.r0, calculator.beta)
+    if hasattr(calculator, "anchor"):
+        A = A + calculator.anchor
+    if module.__name__ == "smarts_old":
+        # The old calculator keeps the pen arm angle absolute
+        return A + module.vecp(calculator.r, calculator.alpha)
+    return A + module.vecp(calculator.r, calculator.alpha + calculator.beta)
+
+
+def bench_calculator(module, solver, moves, scale, r, alpha, budget):
+    module = import_module(module)
+    if solver is None:
+        calculator = module.Calculator(r, alpha)
+    else:
+        calculator = module.Calculator(r, alpha, solver=solver)
+
+    # Count the inner evaluations of whichever solver is in use
+    counter = [0]
+    for method in ("_loss", "_nanomove"):
+        if hasattr(calculator, method):
+            inner = getattr(calculator, method)
+
+            def counted(*args, inner=inner):
+                counter[0] += 1
+                return inner(*args)
+
+            setattr(calculator, method, counted)
+
+    start = position(calculator, module)
+    x, y = start.x, start.y
+
+    times = []
+    evaluations = []
+    iterations = []
+    errors = []
+    timed_out = False
+
+    signal.signal(signal.SIGALRM, _timeout)
+    signal.setitimer(signal.ITIMER_REAL, budget)
+    try:
+        for dx, dy in moves:
+            counter[0] = 0
+            t = time.perf_counter()
+            calculator.move(dx * scale, dy * scale)
+            times.append(time.perf_counter() - t)
+            evaluations.append(counter[0])
+            iterations.append(getattr(calculator, "iterations", 0))
+
+            x += dx * scale
+            y += dy * scale
+            B = position(calculator, module)
+            errors.append(sqrt((B.x - x) ** 2 + (B.y - y) ** 2))
+    except Timeout:
+        timed_out = True
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+    failures = getattr(calculator, "failures", 0)
+    return times, evaluations, iterations, errors, failures, timed_out
+
+
+def bench_batch(moves, scale, r, alpha):
+    import numpy as np
+    from smarts import solve_moves
+
+    t = time.perf_counter()
+    d_angles = solve_moves(moves, scale, r, alpha)
+    total = time.perf_counter() - t
+
+    r0 = 400 / ((1 / r) + 1)
+    r = 400 / (r + 1)
+    alpha = tau / 2 - alpha
+    angles = np.array([alpha, 0]) + np.cumsum(d_angles, axis=0)
+    pen = np.stack(
+        [
+            r0 * np.cos(angles[:, 1]) + r * np.cos(angles.sum(axis=1)),
+            r0 * np.sin(angles[:, 1]) + r * np.sin(angles.sum(axis=1)),
+        ],
+        axis=1,
+    )
+    targets = np.array([r0 + r * np.cos(alpha), r * np.sin(alpha)]) + np.cumsum(
+        np.asarray(moves, dtype=np.float64) * scale, axis=0
+    )
+    errors = np.hypot(*(pen - targets).T).tolist()
+
+    times = [total / len(moves)] * len(moves)
+    return times, [0] * len(moves), [0] * len(moves), errors, 0, False
+
+
+def summary(values):
+    if not values:
+        return None
+    return {"mean": sum(values) / len(values), "max": max(values)}
+
+
+def bench(names, budget, curves=None):
+    results = []
+
+    for curve, moves, scale, r, alpha in jobs():
+        if curves and curve not in curves:
+            continue
+
+        for name in names:
+            module, solver = CALCULATORS[name]
+            result = {"curve": curve, "calculator": name, "moves": len(moves)}
+            try:
+                if name == "smarts-batch":
+                    run = bench_batch(moves, scale, r, alpha)
+                else:
+                    run = bench_calculator(
+                        module, solver, moves, scale, r, alpha, budget
+                    )
+            except ImportError as error:
+                result["skipped"] = str(error)
+                results.append(result)
+                print(f"{curve:10} {name:18} skipped ({error})")
+                continue
+
+            times, evaluations, iterations, errors, failures, timed_out = run
+            result.update(
+                {
+                    "solved": len(times),
+                    "timed_out": timed_out,
+                    "failures": failures,
+                    "total_time": sum(times),
+                    "time_per_move": summary(times),
+                    "evaluations_per_move": summary(evaluations),
+                    "iterations_per_move": summary(iterations),
+                    "error": summary(errors),
+                }
+            )
+            results.append(result)
+
+            error = result["error"]["max"] if errors else float("nan")
+            print(
+                f"{curve:10} {name:18} {len(times):6}/{len(moves):<6}"
+                f" {sum(times):9.4f}s"
+                f" {sum(times) / max(len(times), 1) * 1e6:11.1f}us/move"
+                f" max error {error:.2e}"
+                + (f" {failures} failed" if failures else "")
+                + (" (timed out)" if timed_out else "")
+            )
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the IK calculators")
+    parser.add_argument(
+        "-c",
+        "--calculators",
+        nargs="+",
+        choices=list(CALCULATORS),
+        default=list(CALCULATORS),
+    )
+    parser.add_argument("--curves", nargs="+", help="Curve names, default all")
+    parser.add_argument(
+        "-b",
+        "--budget",
+        type=float,
+        default=10,
+        help="Seconds per curve and calculator before giving up",
+    )
+    parser.add_argument("-o", "--output", default="benchmark.json")
+    args = parser.parse_args()
+
+    results = bench(args.calculators, args.budget, args.curves)
+
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
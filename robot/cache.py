@@ -0,0 +1,117 @@
+import os
+import struct
+from array import array
+
+from pairs import Pairs, collect
+
+try:
+    from binascii import crc32 as checksum
+except ImportError:
+
+    def checksum(data, value=1):
+        # Adler-32, for MicroPython builds without binascii.crc32, continues
+        # from value like crc32 does
+        a, b = value & 0xFFFF, value >> 16
+        for byte in data:
+            a = (a + byte) % 65521
+            b = (b + a) % 65521
+        return (b << 16) | a
+
+
+# Entry file: header, key, then the pairs as interleaved float32
+MAGIC = b"PLTC"
+VERSION = 1
+HEADER = "<4sHHII"  # magic, version, key length, pair count, payload checksum
+HEADER_SIZE = struct.calcsize(HEADER)
+
+
+class Cache:
+    # Pairs of (x, y) stored on disk under string keys, one file per
+    # key. Generated moves are keyed by curve and iteration, solved angle
+    # changes by the full geometry on top of that. Once the directory grows
+    # past max_bytes the oldest entries get evicted.
+
+    def __init__(self, path="cache", max_bytes=4000000) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        try:
+            os.mkdir(path)
+        except OSError:
+            pass
+
+    def _file(self, key):
+        return f"{self.path}/{checksum(key.encode()) & 0xFFFFFFFF:08x}.bin"
+
+    def load(self, key):
+        name = self._file(key)
+        key = key.encode()
+        try:
+            with open(name, "rb") as file:
+                header = file.read(HEADER_SIZE)
+                if len(header) != HEADER_SIZE:
+                    return None
+                magic, version, key_size, count, check = struct.unpack(HEADER, header)
+                if magic != MAGIC or version != VERSION:
+                    return None
+                if file.read(key_size) != key:
+                    return None
+                # Check the count against the file before trusting it
+                if os.stat(name)[6] != HEADER_SIZE + key_size + count * 8:
+                    return None
+                data = bytearray(count * 8)
+                if file.readinto(data) != len(data) or file.read(1):
+                    return None
+        except OSError:
+            return None
+
+        if checksum(data) & 0xFFFFFFFF != check:
+            return None
+
+        return Pairs(array("f", data))
+
+    def store(self, key, pairs):
+        if not isinstance(pairs, Pairs) or pairs.typecode != "f":
+            pairs = collect(pairs)
+        data = bytearray(pairs.values)
+
+        name = self._file(key)
+        key = key.encode()
+        with open(name, "wb") as file:
+            file.write(
+                struct.pack(
+                    HEADER,
+                    MAGIC,
+                    VERSION,
+                    len(key),
+                    len(pairs),
+                    checksum(data) & 0xFFFFFFFF,
+                )
+            )
+            file.write(key)
+            file.write(data)
+
+        self.evict()
+
+    def get(self, key, compute):
+        pairs = self.load(key)
+        if pairs is None:
+            pairs = compute()
+            if not isinstance(pairs, Pairs):
+                pairs = collect(pairs)
+            self.store(key, pairs)
+        return pairs
+
+    def evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.path):
+            path = f"{self.path}/{name}"
+            stat = os.stat(path)
+            entries.append((stat[8], stat[6], path))  # mtime, size
+            total += stat[6]
+
+        entries.sort()
+        while total > self.max_bytes and len(entries) > 1:
+            mtime, size, path = entries.pop(0)
+            os.remove(path)
+            total -= size
@@ -0,0 +1,86 @@
+import argparse
+from math import tau
+
+import patterns
+from motion import Scheduler, Quantizer, gear_ratio
+from trajectory import write
+from smarts_for_stupids import Calculator
+
+# The plotter as physical.run drives it, compiled files only stream on a
+# brick with the same gears
+PAPER_TURNER_GEARS = [1, 40]
+PEN_TURNER_GEARS = [8, 40]
+PAPER_TURNER_MAX_SPEED = 800
+PAPER_TURNER_MAX_ACCELERATION = 1600
+PEN_TURNER_MAX_SPEED = 800
+PEN_TURNER_MAX_ACCELERATION = 1600
+SOLVER = "analytic"
+
+
+def compile_moves(moves, scale, r, alpha):
+    # (d_alpha, d_beta, speed_alpha, speed_beta, ms) for every move the
+    # motors make, solved, quantized and scheduled the way physical.run does
+    calculator = Calculator(r, alpha, solver=SOLVER)
+    quantizer = Quantizer(PEN_TURNER_GEARS, PAPER_TURNER_GEARS)
+    scheduler = Scheduler(
+        PEN_TURNER_GEARS,
+        PAPER_TURNER_GEARS,
+        (PEN_TURNER_MAX_SPEED, PAPER_TURNER_MAX_SPEED),
+        (PEN_TURNER_MAX_ACCELERATION, PAPER_TURNER_MAX_ACCELERATION),
+    )
+
+    for move in moves:
+        d_alpha, d_beta = calculator.move(move[0] * scale, move[1] * scale)
+        angles = quantizer.quantize(d_alpha * 360 / tau, d_beta * 360 / tau)
+        if angles is None:
+            continue
+        yield angles + scheduler.schedule(*angles)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compile a curve into motor commands for physical.run"
+    )
+    parser.add_argument("curve", choices=patterns.CURVES)
+    parser.add_argument(
+        "-i", "--iteration", type=int, help="Replaces the curve's last argument"
+    )
+    parser.add_argument("-s", "--scale", type=float)
+    parser.add_argument("-d", "--centers-distance", type=float, default=1)
+    parser.add_argument("-a", "--start-angle", type=float, default=patterns.start_angle)
+    parser.add_argument("--tolerance", type=float)
+    parser.add_argument("--straightness", type=float, default=patterns.STRAIGHTNESS)
+    parser.add_argument("-o", "--output", help="Default <curve>.trj")
+    args = parser.parse_args()
+
+    curve_args = None
+    if args.iteration is not None:
+        curve_args = patterns.CURVE_SETTINGS[args.curve][1]
+        if not curve_args:
+            parser.error(f"{args.curve} takes no iteration")
+        curve_args = curve_args[:-1] + (args.iteration,)
+
+    moves, scale = patterns.curve(
+        args.curve,
+        curve_args,
+        args.centers_distance,
+        args.tolerance,
+        args.straightness,
+        args.scale,
+        args.start_angle,
+    )
+    records = list(compile_moves(moves, scale, args.centers_distance, args.start_angle))
+
+    output = args.output or f"{args.curve.lower()}.trj"
+    name = f"{args.curve} {curve_args or patterns.CURVE_SETTINGS[args.curve][1]}"
+    ratios = (gear_ratio(PEN_TURNER_GEARS), gear_ratio(PAPER_TURNER_GEARS))
+    write(
+        output,
+        name,
+        scale,
+        args.centers_distance,
+        args.start_angle,
+        ratios,
+        records,
+    )
+    print(f"{len(records)} moves, {sum(r[4] for r in records) / 1000:.1f}s")
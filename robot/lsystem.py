@@ -0,0 +1,133 @@
+FORWARD = "F"
+
+
+class LSystem:
+    # Rules map a symbol to its replacement, "+" and "-" turn by angle
+    # degrees and "F" moves the turtle forward. Symbols in draw also move
+    # forward once they are not expanded any further, symbols in steps move
+    # by a fixed (dx, dy).
+    #
+    # Expansion runs on an explicit stack, so deep iterations don't hit the
+    # recursion limit, and segments of up to memo_size ops are kept per
+    # (symbol, depth) so they only get expanded once.
+
+    def __init__(
+        self, axiom, rules, angle=90, draw="", steps=None, memo_size=1024
+    ) -> None:
+        self.angle = angle
+        self.draw = draw
+        self.steps = steps or {}
+        self.memo_size = memo_size
+
+        self.axiom = self._compile(axiom)
+        self.rules = {}
+        for symbol, rule in rules.items():
+            self.rules[symbol] = self._compile(rule)
+
+        self.memo = {}
+        self.memo_depth = 0  # Depth up to which the memo has been filled
+        self.memo_full = False  # Segments got too long at memo_depth
+
+    def _compile(self, rule):
+        # Turns become ints counting angle steps, neighbouring turns are
+        # folded into one, fixed steps become their (dx, dy)
+        tokens = []
+        for symbol in rule:
+            if symbol in "+-":
+                turn = 1 if symbol == "+" else -1
+                if tokens and isinstance(tokens[-1], int):
+                    turn += tokens.pop()
+                if turn:
+                    tokens.append(turn)
+            elif symbol in self.steps:
+                tokens.append(self.steps[symbol])
+            else:
+                tokens.append(symbol)
+        return tokens
+
+    def _draws(self, symbol):
+        return symbol == FORWARD or symbol in self.draw
+
+    def _terminal(self, token):
+        if isinstance(token, str):
+            return [FORWARD] if self._draws(token) else []
+        return [token]
+
+    def _fill_memo(self, depth):
+        # Bottom up: segments of one depth are joined from the previous one
+        while self.memo_depth < depth and not self.memo_full:
+            d = self.memo_depth + 1
+            found = False
+            for symbol, tokens in self.rules.items():
+                segment = []
+                for token in tokens:
+                    if isinstance(token, str) and token in self.rules:
+                        part = (
+                            self._terminal(token)
+                            if d == 1
+                            else self.memo.get((token, d - 1))
+                        )
+                        if part is None:
+                            segment = None
+                            break
+                    else:
+                        part = self._terminal(token)
+                    if (
+                        part
+                        and segment
+                        and isinstance(part[0], int)
+                        and isinstance(segment[-1], int)
+                    ):
+                        segment[-1] += part[0]
+                        if not segment[-1]:
+                            segment.pop()
+                        segment.extend(part[1:])
+                    else:
+                        segment.extend(part)
+                    if len(segment) > self.memo_size:
+                        segment = None
+                        break
+                if segment is not None:
+                    self.memo[(symbol, d)] = segment
+                    found = True
+            self.memo_depth = d
+            self.memo_full = not found
+
+    def ops(self, iteration):
+        # Terminal ops: FORWARD, an int turn or a (dx, dy) step
+        self._fill_memo(iteration)
+
+        stack = [[self.axiom, 0, iteration]]
+        while stack:
+            frame = stack[-1]
+            tokens, i, depth = frame
+            if i == len(tokens):
+                stack.pop()
+                continue
+            frame[1] = i + 1
+
+            token = tokens[i]
+            if isinstance(token, str) and token in self.rules and depth > 0:
+                segment = self.memo.get((token, depth))
+                if segment is None:
+                    stack.append([self.rules[token], 0, depth - 1])
+                else:
+                    stack.append([segment, 0, 0])
+            elif isinstance(token, str):
+                if self._draws(token):
+                    yield FORWARD
+            else:
+                yield token
+
+    def moves(self, iteration, turtle):
+        turn = 0
+        for op in self.ops(iteration):
+            if op == FORWARD:
+                if turn:
+                    turtle.rotate(turn * self.angle)
+                    turn = 0
+                yield turtle.forward()
+            elif isinstance(op, int):
+                turn += op
+            else:
+                yield op
@@ -13,7 +13,7 @@ from pybricks.tools import wait, StopWatch, DataLog
 from pybricks.robotics import DriveBase
 from pybricks.media.ev3dev import SoundFile, ImageFile
 
-from math import tau, sin, cos, atan2, sqrt
+from math import tau, sin, cos, atan2, sqrt, acos
 
 
 ############ Constants ############
@@ -23,9 +23,14 @@ PAPER_TURNER_PORT = "A"
 PAPER_TURNER_GEARS = [1, 40]
 PEN_TURNER_PORT = "B"
 PEN_TURNER_GEARS = [8, 40]
-MOVES_PER_SECOND = 5
+# Limits at the motor shaft in deg/s and deg/s/s
+PAPER_TURNER_MAX_SPEED = 800
+PAPER_TURNER_MAX_ACCELERATION = 1600
+PEN_TURNER_MAX_SPEED = 800
+PEN_TURNER_MAX_ACCELERATION = 1600
 INVERT_PAPER_TURNER = False
 INVERT_PEN_TURNER = False
+SOLVER = "analytic"
 
 
 ############ Patterns and Curves ############
@@ -403,15 +408,31 @@ def vecp(rho, phi):
     return Vec(rho * cos(phi), rho * sin(phi))
 
 
+def wrap(angle):
+    return (angle + tau / 2) % tau - tau / 2
+
+
+def solve(r0, r, x, y, elbow=1):
+    # Pen arm angle from the law of cosines, paper angle from atan2.
+    # Targets out of reach are clamped to the closest reachable point.
+    c = (x * x + y * y - r0 * r0 - r * r) / (2 * r0 * r)
+    alpha = elbow * acos(max(-1, min(1, c)))
+    beta = atan2(y, x) - atan2(r * sin(alpha), r0 + r * cos(alpha))
+    return alpha, beta
+
+
 class Calculator:
 
-    def __init__(self, r, alpha, precision=1e-2) -> None:
+    def __init__(self, r, alpha, precision=1e-2, solver="descent") -> None:
         self.r0 = 400 / ((1 / r) + 1)  # Distance of the two centers of rotation
         self.r = 400 / (
             r + 1
         )  # The distance of the two centers of rotation, divided by the pen arm length
         self.alpha = tau / 2 - alpha  # Angle between the pen arm and the paper rotator
         self.precision = precision  # Max numerical step width
+        if solver not in ("descent", "analytic"):
+            raise ValueError(f"Unknown solver {solver}")
+        self.solver = solver
 
         self.beta = 0
 
@@ -430,6 +451,17 @@ class Calculator:
     def move(self, dx, dy):
         self.target_B += Vec(dx, dy)
 
+        if self.solver == "analytic":
+            self._solve_analytic()
+        else:
+            self._solve_descent()
+
+        self.alpha += self.d_alpha
+        self.beta += self.d_beta
+
+        return self.d_alpha, self.d_beta
+
+    def _solve_descent(self):
         p = self.precision
 
         self.d_alpha = self.d_beta = 0
@@ -447,10 +479,77 @@ class Calculator:
             self.d_beta -= 0.0000001 * m_beta + w
             loss = self._loss()
 
-        self.alpha += self.d_alpha
-        self.beta += self.d_beta
-
-        return self.d_alpha, self.d_beta
+    def _solve_analytic(self):
+        # Stay on the current elbow side so the arm never flips mid drawing
+        elbow = 1 if sin(self.alpha) >= 0 else -1
+        alpha, beta = solve(self.r0, self.r, self.target_B.x, self.target_B.y, elbow)
+
+        self.d_alpha = wrap(alpha - self.alpha)
+        self.d_beta = wrap(beta - self.beta)
+
+
+############ Motion ############
+
+
+def gear_ratio(gears):
+    # Motor degrees per output degree, for a gears argument as pybricks
+    # takes it: a list of teeth or a list of such gear trains
+    if isinstance(gears[0], (list, tuple)):
+        ratio = 1
+        for train in gears:
+            ratio *= train[-1] / train[0]
+        return ratio
+    return gears[-1] / gears[0]
+
+
+def duration(angle, speed, acceleration):
+    # Shortest time to turn angle from standstill to standstill
+    angle = abs(angle)
+    if angle * acceleration < speed * speed:
+        return 2 * sqrt(angle / acceleration)
+    return angle / speed + speed / acceleration
+
+
+def cruise_speed(angle, time, acceleration):
+    # Speed at which a move accelerating at acceleration takes exactly time
+    angle = abs(angle)
+    a = acceleration * time
+    return (a - sqrt(max(0, a * a - 4 * acceleration * angle))) / 2
+
+
+class Scheduler:
+    # Times each move by the joint that needs longest, with the speed and
+    # acceleration limits of each motor given at the motor shaft, and slows
+    # the other joint down so both finish together
+
+    def __init__(
+        self,
+        alpha_gears,
+        beta_gears,
+        max_speeds=(800, 800),
+        max_accelerations=(1600, 1600),
+        min_time=0.02,
+    ) -> None:
+        ratios = (gear_ratio(alpha_gears), gear_ratio(beta_gears))
+        self.speeds = [speed / ratio for speed, ratio in zip(max_speeds, ratios)]
+        self.accelerations = [
+            acceleration / ratio
+            for acceleration, ratio in zip(max_accelerations, ratios)
+        ]
+        self.min_time = min_time  # Seconds
+
+    def schedule(self, d_alpha, d_beta):
+        # Output degrees in, (speed_alpha, speed_beta, milliseconds) out
+        time = max(
+            duration(d_alpha, self.speeds[0], self.accelerations[0]),
+            duration(d_beta, self.speeds[1], self.accelerations[1]),
+            self.min_time,
+        )
+        return (
+            cruise_speed(d_alpha, time, self.accelerations[0]),
+            cruise_speed(d_beta, time, self.accelerations[1]),
+            time * 1000,
+        )
 
 
 ############ Driver ############
@@ -472,7 +571,33 @@ def run(moves, scale, r, alpha, ev3):
         gears=PEN_TURNER_GEARS,
     )
 
-    calculator = Calculator(r, alpha)
+    # Make the motors accelerate the way the scheduler expects them to
+    for motor, gears, speed, acceleration in (
+        (
+            paper_turner,
+            PAPER_TURNER_GEARS,
+            PAPER_TURNER_MAX_SPEED,
+            PAPER_TURNER_MAX_ACCELERATION,
+        ),
+        (
+            pen_turner,
+            PEN_TURNER_GEARS,
+            PEN_TURNER_MAX_SPEED,
+            PEN_TURNER_MAX_ACCELERATION,
+        ),
+    ):
+        ratio = gear_ratio(gears)
+        motor.control.limits(
+            speed / ratio, acceleration / ratio, motor.control.limits()[2]
+        )
+    scheduler = Scheduler(
+        PEN_TURNER_GEARS,
+        PAPER_TURNER_GEARS,
+        (PEN_TURNER_MAX_SPEED, PAPER_TURNER_MAX_SPEED),
+        (PEN_TURNER_MAX_ACCELERATION, PAPER_TURNER_MAX_ACCELERATION),
+    )
+
+    calculator = Calculator(r, alpha, solver=SOLVER)
 
     angle_changes = []
 
@@ -487,13 +612,12 @@ def run(moves, scale, r, alpha, ev3):
     for d_alpha, d_beta in angle_changes:
         i += 0
         ev3.display.text(f"{round(i/len(angle_changes)*100)}%")
-        pen_turner.run_angle(
-            d_alpha * MOVES_PER_SECOND * 1.1, d_alpha, then=Stop.HOLD, wait=False
-        )
-        paper_turner.run_angle(
-            d_beta * MOVES_PER_SECOND * 1.1, d_beta, then=Stop.HOLD, wait=False
-        )
-        wait(1000 / MOVES_PER_SECOND)
+        speed_alpha, speed_beta, time = scheduler.schedule(d_alpha, d_beta)
+        if d_alpha:
+            pen_turner.run_angle(speed_alpha, d_alpha, then=Stop.HOLD, wait=False)
+        if d_beta:
+            paper_turner.run_angle(speed_beta, d_beta, then=Stop.HOLD, wait=False)
+        wait(time)
 
     ev3.display.text(f"Done.")
     ev3.speaker.beep()
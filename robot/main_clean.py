@@ -16,6 +16,7 @@ from pybricks.media.ev3dev import SoundFile, ImageFile
 
 from patterns import draw_curve, CURVES
 from physical import run
+from cache import Cache
 
 
 # This program requires LEGO EV3 MicroPython v2.0 or higher.
@@ -24,6 +25,9 @@ from physical import run
 
 # Create your objects here.
 ev3 = EV3Brick()
+cache = Cache()
+# Trajectories from compiler.py, <curve>.trj, get streamed instead of solved
+COMPILED = "compiled"
 
 
 while 1:
@@ -51,4 +55,10 @@ while 1:
 
     ev3.speaker.beep()
     ev3.light(Color.YELLOW)
-    draw_curve(CURVES[selected_curve], run, 1, ev3)
+    path = f"{COMPILED}/{CURVES[selected_curve].lower()}.trj"
+    try:
+        open(path).close()
+    except OSError:
+        draw_curve(CURVES[selected_curve], run, 1, ev3, cache)
+    else:
+        run(None, None, None, None, ev3, commands=path)
@@ -0,0 +1,113 @@
+from math import sqrt
+
+
+def gear_ratio(gears):
+    # Motor degrees per output degree, for a gears argument as pybricks
+    # takes it: a list of teeth or a list of such gear trains
+    if isinstance(gears[0], (list, tuple)):
+        ratio = 1
+        for train in gears:
+            ratio *= train[-1] / train[0]
+        return ratio
+    return gears[-1] / gears[0]
+
+
+def duration(angle, speed, acceleration):
+    # Shortest time to turn angle from standstill to standstill
+    angle = abs(angle)
+    if angle * acceleration < speed * speed:
+        return 2 * sqrt(angle / acceleration)
+    return angle / speed + speed / acceleration
+
+
+def cruise_speed(angle, time, acceleration):
+    # Speed at which a move accelerating at acceleration takes exactly time
+    angle = abs(angle)
+    a = acceleration * time
+    return (a - sqrt(max(0, a * a - 4 * acceleration * angle))) / 2
+
+
+class Scheduler:
+    # Times each move by the joint that needs longest, with the speed and
+    # acceleration limits of each motor given at the motor shaft, and slows
+    # the other joint down so both finish together
+
+    def __init__(
+        self,
+        alpha_gears,
+        beta_gears,
+        max_speeds=(800, 800),
+        max_accelerations=(1600, 1600),
+        min_time=0.02,
+    ) -> None:
+        ratios = (gear_ratio(alpha_gears), gear_ratio(beta_gears))
+        self.speeds = [speed / ratio for speed, ratio in zip(max_speeds, ratios)]
+        self.accelerations = [
+            acceleration / ratio
+            for acceleration, ratio in zip(max_accelerations, ratios)
+        ]
+        self.min_time = min_time  # Seconds
+
+    def schedule(self, d_alpha, d_beta):
+        # Output degrees in, (speed_alpha, speed_beta, milliseconds) out
+        time = max(
+            duration(d_alpha, self.speeds[0], self.accelerations[0]),
+            duration(d_beta, self.speeds[1], self.accelerations[1]),
+            self.min_time,
+        )
+        return (
+            cruise_speed(d_alpha, time, self.accelerations[0]),
+            cruise_speed(d_beta, time, self.accelerations[1]),
+            time * 1000,
+        )
+
+
+class Quantizer:
+    # Rounds joint deltas to whole degrees at the motor shaft, the encoder
+    # resolution, and carries the rounding error over into the next move so
+    # it never adds up
+
+    def __init__(self, alpha_gears, beta_gears) -> None:
+        self.ratios = (gear_ratio(alpha_gears), gear_ratio(beta_gears))
+        self.residuals = [0, 0]
+
+    def quantize(self, d_alpha, d_beta):
+        # Output degrees in and out, None if neither motor has to move
+        result = []
+        for i, angle in enumerate((d_alpha, d_beta)):
+            counts = angle * self.ratios[i] + self.residuals[i]
+            whole = round(counts)
+            self.residuals[i] = counts - whole
+            result.append(whole / self.ratios[i])
+
+        if not result[0] and not result[1]:
+            return None
+        return result[0], result[1]
+
+
+class Pipeline:
+    # Bounded queue between the solver and the motor loop. While the motors
+    # run a move, fill() solves ahead until the move is due to end, but never
+    # more than depth moves, so memory stays bounded by depth.
+
+    def __init__(self, source, depth=32) -> None:
+        self.source = iter(source)
+        self.depth = depth
+        self.queue = []
+        self.done = False
+
+    def _next(self):
+        try:
+            self.queue.append(next(self.source))
+        except StopIteration:
+            self.done = True
+
+    def fill(self, clock, deadline):
+        while not self.done and len(self.queue) < self.depth and clock() < deadline:
+            self._next()
+
+    def pop(self):
+        # The next move, solved right away if the queue ran dry
+        if not self.queue and not self.done:
+            self._next()
+        return self.queue.pop(0) if self.queue else None
@@ -0,0 +1,38 @@
+from array import array
+
+
+class Pairs:
+    # List of (x, y) pairs, moves or angle changes, stored interleaved in a
+    # flat array so a pair costs 8 bytes instead of a tuple and two floats
+
+    def __init__(self, values=None, typecode="f") -> None:
+        self.typecode = typecode
+        self.values = array(typecode) if values is None else values
+
+    def __len__(self):
+        return len(self.values) // 2
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        return self.values[2 * i], self.values[2 * i + 1]
+
+    def __iter__(self):
+        values = self.values
+        for i in range(0, len(values), 2):
+            yield values[i], values[i + 1]
+
+    def append(self, x, y):
+        self.values.append(x)
+        self.values.append(y)
+
+    def extend(self, pairs):
+        for x, y in pairs:
+            self.values.append(x)
+            self.values.append(y)
+
+
+def collect(moves, typecode="f"):
+    pairs = Pairs(typecode=typecode)
+    pairs.extend(moves)
+    return pairs
@@ -1,266 +1,151 @@
 from math import tau, sin, cos
 
+from lsystem import LSystem
+from simplify import simplify, subdivide
+
+
+class Turtle:
+    # Heading of a pattern, every pattern owns its own turtle so patterns
+    # can be generated side by side. Given steps, the heading is an index
+    # into a cos/sin table of steps directions around the circle instead, so
+    # forward() needs no trig and long patterns don't drift. Turns then have
+    # to be multiples of 360 / steps degrees.
+
+    def __init__(self, direction=0, steps=None) -> None:
+        self.direction = direction
+        self.steps = steps
+        if steps is not None:
+            self.heading = 0
+            self.cos = [cos(direction + i * tau / steps) for i in range(steps)]
+            self.sin = [sin(direction + i * tau / steps) for i in range(steps)]
+
+    def rotate(self, phi):
+        if self.steps is None:
+            self.direction += phi / 360 * tau
+            return
+
+        turn = phi * self.steps / 360
+        if abs(turn - round(turn)) > 1e-9:
+            raise ValueError(f"Turn {phi} is no multiple of {360 / self.steps}")
+        self.heading = (self.heading + round(turn)) % self.steps
+
+    def forward(self, r=1):
+        if self.steps is None:
+            return (cos(self.direction) * r, sin(self.direction) * r)
+        return (self.cos[self.heading] * r, self.sin[self.heading] * r)
+
+
+GOSPER = LSystem(
+    "A",
+    {"A": "A-B--B+A++AA+B-", "B": "+A-BB--B-A++A+B"},
+    angle=60,
+    draw="AB",
+)
+
+GREEK = LSystem(
+    "A",
+    {"A": "+BFBF-AFAFA-F-AF+BFB+FA", "B": "-AFAF+BFBFB+F+BF-AFA-FB"},
+)
+
+
+# Every pattern is a generator yielding (dx, dy) moves one at a time
+
+
+def hilbert_cell(iteration, index):
+    # Cell (x, y) the Hilbert curve of order iteration visits index-th, by
+    # the usual d2xy bit twiddling from the lowest level up
+    x = y = 0
+    s = 1
+    while s < 1 << iteration:
+        rx = 1 & (index >> 1)
+        ry = 1 & (index ^ rx)
+        if not ry:
+            if rx:
+                x, y = s - 1 - x, s - 1 - y
+            x, y = y, x
+        x += s * rx
+        y += s * ry
+        index >>= 2
+        s <<= 1
+    return x, y
+
+
+def hilbert(iteration, direction=0, start=0):
+    # Moves from move start on, each cell computed from its index alone, so
+    # any order runs in constant memory and a drawing can resume anywhere.
+    # The curve keeps its orientation whatever the direction.
+    x, y = hilbert_cell(iteration, start)
+    for index in range(start + 1, 1 << 2 * iteration):
+        next_x, next_y = hilbert_cell(iteration, index)
+        yield next_x - x, y - next_y
+        x, y = next_x, next_y
+
+
+def gosper(iteration, direction=0):
+    return GOSPER.moves(iteration, Turtle(direction, 360 // GOSPER.angle))
+
+
+def euler(direction=0):
+    turtle = Turtle(direction)
 
-moves = []
-
-direction = 0
+    for a in range(-180, 181, 1):
+        yield turtle.forward(0.3)
+        turtle.rotate(a)
 
 
-def l():
-    moves.append([-1, 0])
-
-
-def u():
-    moves.append([0, -1])
-
-
-def r():
-    moves.append([1, 0])
-
-
-def d():
-    moves.append([0, 1])
-
-
-def rotate(phi):
-    global direction
-    direction += phi / 360 * tau
-
-
-def forward(r=1):
-    global moves
-    global direction
-    moves.append([cos(direction) * r, sin(direction) * r])
-
-
-def hilbert(iteration):
-    global direction, moves
-    moves = []
-
-    def A(depth):
-        if depth > 0:
-            D(depth - 1)
-            u()
-            A(depth - 1)
-            r()
-            A(depth - 1)
-            d()
-            B(depth - 1)
-
-    def B(depth):
-        if depth > 0:
-            C(depth - 1)
-            l()
-            B(depth - 1)
-            d()
-            B(depth - 1)
-            r()
-            A(depth - 1)
-
-    def C(depth):
-        if depth > 0:
-            B(depth - 1)
-            d()
-            C(depth - 1)
-            l()
-            C(depth - 1)
-            u()
-            D(depth - 1)
-
-    def D(depth):
-        if depth > 0:
-            A(depth - 1)
-            r()
-            D(depth - 1)
-            u()
-            D(depth - 1)
-            l()
-            C(depth - 1)
-
-    A(iteration)
-
-    return moves
-
-
-def gosper(iteration):
-    global direction, moves
-    moves = []
-
-    def A(depth):
-        if depth > 0:
-            A(depth - 1)
-            rotate(-60)
-            B(depth - 1)
-            rotate(-60)
-            rotate(-60)
-            B(depth - 1)
-            rotate(60)
-            A(depth - 1)
-            rotate(60)
-            rotate(60)
-            A(depth - 1)
-            A(depth - 1)
-            rotate(60)
-            B(depth - 1)
-            rotate(-60)
-        else:
-            forward()
-
-    def B(depth):
-        if depth > 0:
-            rotate(60)
-            A(depth - 1)
-            rotate(-60)
-            B(depth - 1)
-            B(depth - 1)
-            rotate(-60)
-            rotate(-60)
-            B(depth - 1)
-            rotate(-60)
-            A(depth - 1)
-            rotate(60)
-            rotate(60)
-            A(depth - 1)
-            rotate(60)
-            B(depth - 1)
-        else:
-            forward()
-
-    A(iteration)
-
-    return moves
-
-
-def euler():
-    global direction, moves
-    moves = []
+def spiral(turns, direction=0):
+    turtle = Turtle(direction)
 
-    for a in range(-180, 181, 1):
-        forward(0.3)
-        rotate(a)
+    for a in range(1, 100 * turns):
+        yield turtle.forward(a / (10 * turns))
+        turtle.rotate(3.6)
 
-    return moves
 
+def greek(iteration, direction=0):
+    turtle = Turtle(direction + 230 / 360 * tau, 360 // GREEK.angle)
+    return GREEK.moves(iteration, turtle)
 
-def spiral(turns):
-    global direction, moves
-    moves = []
 
-    for a in range(1, 100 * turns):
-        forward(a / (10 * turns))
-        rotate(3.6)
-
-    return moves
-
-
-def greek(iteration):
-    global direction, moves
-    moves = []
-
-    def A(depth):
-        if depth > 0:
-            rotate(90)
-            B(depth - 1)
-            forward()
-            B(depth - 1)
-            forward()
-            rotate(-90)
-            A(depth - 1)
-            forward()
-            A(depth - 1)
-            forward()
-            A(depth - 1)
-            rotate(-90)
-            forward()
-            rotate(-90)
-            A(depth - 1)
-            forward()
-            rotate(90)
-            B(depth - 1)
-            forward()
-            B(depth - 1)
-            rotate(90)
-            forward()
-            A(depth - 1)
-
-    def B(depth):
-        if depth > 0:
-            rotate(-90)
-            A(depth - 1)
-            forward()
-            A(depth - 1)
-            forward()
-            rotate(90)
-            B(depth - 1)
-            forward()
-            B(depth - 1)
-            forward()
-            B(depth - 1)
-            rotate(90)
-            forward()
-            rotate(90)
-            B(depth - 1)
-            forward()
-            rotate(-90)
-            A(depth - 1)
-            forward()
-            A(depth - 1)
-            rotate(-90)
-            forward()
-            B(depth - 1)
-
-    rotate(230)
-    A(iteration)
-
-    return moves
-
-
-def squares(subdiv, count):
-    global direction, moves
-    moves = []
+def squares(subdiv, count, direction=0):
+    turtle = Turtle(direction, count * 4 - 1)
 
     for _ in range(count * 4 - 1):
         for _ in range(subdiv):
-            forward(1 / subdiv)
-        rotate(90 + 90 / (count * 4 - 1))
+            yield turtle.forward(1 / subdiv)
+        turtle.rotate(90 + 90 / (count * 4 - 1))
 
-    return moves
 
-
-def grid(iterations):
-    global direction, moves
-    moves = []
+def grid(iterations, direction=0):
+    turtle = Turtle(direction, 4)
 
     for i in range(iterations):
         for j in range(4):
             for _ in range(iterations - (j == 3) - i):
-                forward()
-                rotate(-90 if i % 2 else 90)
-                forward()
-                rotate(90 if i % 2 else -90)
-            forward()
-            rotate(90 if i % 2 else -90)
-
-    forward()
-    rotate(90 if iterations % 2 else -90)
-    forward()
+                yield turtle.forward()
+                turtle.rotate(-90 if i % 2 else 90)
+                yield turtle.forward()
+                turtle.rotate(90 if i % 2 else -90)
+            yield turtle.forward()
+            turtle.rotate(90 if i % 2 else -90)
+
+    yield turtle.forward()
+    turtle.rotate(90 if iterations % 2 else -90)
+    yield turtle.forward()
     if not iterations % 2:
-        rotate(90 if iterations % 2 else -90)
-        forward()
-        rotate(90 if iterations % 2 else -90)
-        forward()
+        turtle.rotate(90 if iterations % 2 else -90)
+        yield turtle.forward()
+        turtle.rotate(90 if iterations % 2 else -90)
+        yield turtle.forward()
 
     for i in range((iterations + 1) // 2):
-        rotate(90 if iterations % 2 else -90)
-        forward()
-        rotate(90 if iterations % 2 else -90)
-        forward()
-        rotate(-90 if iterations % 2 else 90)
-        forward()
-        rotate(-90 if iterations % 2 else 90)
-        forward()
-
-    return moves
+        turtle.rotate(90 if iterations % 2 else -90)
+        yield turtle.forward()
+        turtle.rotate(90 if iterations % 2 else -90)
+        yield turtle.forward()
+        turtle.rotate(-90 if iterations % 2 else 90)
+        yield turtle.forward()
+        turtle.rotate(-90 if iterations % 2 else 90)
+        yield turtle.forward()
 
 
 start_angle = tau / 4
@@ -276,45 +161,89 @@ CURVES = [
     "GREEK",
 ]
 
-
-def draw_curve(name, run, centers_distance=1, brick=None):
-    global direction
-
-    if name == "TRIANGLE":
-        direction = tau / 2
-        moves = squares(20, 1)
-        run(moves, 100, centers_distance, start_angle, brick)
-
-    if name == "SQUARES":
-        direction = tau / 2
-        moves = squares(20, 4)
-        run(moves, 100, centers_distance, start_angle, brick)
-
-    if name == "GRID":
-        direction = tau / 2
-        moves = grid(5)
-        run(moves, 15, centers_distance, start_angle, brick)
-
-    if name == "SPIRAL":
-        direction = 0
-        moves = spiral(5)
-        run(moves, 0.5, centers_distance, start_angle, brick)
-
-    if name == "EULER":
-        direction = 0
-        moves = euler()
-        run(moves, 20, centers_distance, start_angle, brick)
-
-    if name == "HILBERT":
-        moves = hilbert(4)
-        run(moves, 7, centers_distance, start_angle, brick)
-
-    if name == "GOSPER":
-        direction = 0
-        moves = gosper(3)
-        run(moves, 10, centers_distance, start_angle, brick)
-
-    if name == "GREEK":
-        direction = 0
-        moves = greek(3)
-        run(moves, 6.5, centers_distance, start_angle, brick)
+# name: (pattern, arguments, start direction, scale)
+CURVE_SETTINGS = {
+    "TRIANGLE": (squares, (1, 1), tau / 2, 100),
+    "SQUARES": (squares, (1, 4), tau / 2, 100),
+    "GRID": (grid, (5,), tau / 2, 15),
+    "SPIRAL": (spiral, (5,), 0, 0.5),
+    "EULER": (euler, (), 0, 20),
+    "HILBERT": (hilbert, (4,), 0, 7),
+    "GOSPER": (gosper, (3,), 0, 10),
+    "GREEK": (greek, (3,), 0, 6.5),
+}
+
+
+# Furthest the pen may stray from a straight move, in drawing units
+STRAIGHTNESS = 0.5
+
+
+def extent(moves):
+    # Width or height of the moves, whichever is larger
+    x = y = 0
+    min_x = max_x = min_y = max_y = 0
+    for dx, dy in moves:
+        x += dx
+        y += dy
+        min_x, max_x = min(min_x, x), max(max_x, x)
+        min_y, max_y = min(min_y, y), max(max_y, y)
+    return max(max_x - min_x, max_y - min_y)
+
+
+def curve(
+    name,
+    args=None,
+    centers_distance=1,
+    tolerance=None,
+    straightness=STRAIGHTNESS,
+    scale=None,
+    alpha=start_angle,
+):
+    # Moves and scale of a curve the way draw_curve draws it. Other args,
+    # e.g. a deeper iteration, get scaled to the same size on paper unless
+    # a scale is given.
+    pattern, base_args, direction, base_scale = CURVE_SETTINGS[name]
+    if args is None:
+        moves = pattern(*base_args, direction=direction)
+    else:
+        moves = list(pattern(*args, direction=direction))
+    if scale is None:
+        scale = base_scale
+        if args is not None:
+            base = pattern(*base_args, direction=direction)
+            scale *= extent(base) / extent(moves)
+
+    if tolerance is not None:
+        # Splitting by joint step is left to subdivide() if it runs
+        max_step = tau / 36 if straightness is None else None
+        moves = simplify(moves, scale, centers_distance, alpha, tolerance, max_step)
+    if straightness is not None:
+        moves = subdivide(moves, scale, centers_distance, alpha, straightness)
+    return moves, scale
+
+
+def draw_curve(
+    name,
+    run,
+    centers_distance=1,
+    brick=None,
+    cache=None,
+    tolerance=None,
+    straightness=STRAIGHTNESS,
+):
+    _, args, _, scale = CURVE_SETTINGS[name]
+
+    def generate():
+        return curve(name, None, centers_distance, tolerance, straightness)[0]
+
+    if cache is None:
+        run(generate(), scale, centers_distance, start_angle, brick)
+        return
+
+    # Moves only depend on the curve, run() caches the solved angles under
+    # this key plus the geometry
+    key = f"moves {name} {args}"
+    if tolerance is not None or straightness is not None:
+        key += f" {tolerance} {straightness} {centers_distance}"
+    moves = cache.get(key, generate)
+    run(moves, scale, centers_distance, start_angle, brick, cache=cache, key=key)
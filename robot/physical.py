@@ -1,4 +1,8 @@
 from smarts_for_stupids import Calculator
+from telemetry import Telemetry
+from pairs import Pairs
+from motion import Scheduler, Quantizer, Pipeline, gear_ratio
+from trajectory import Trajectory
 
 from pybricks.parameters import Port, Stop, Direction, Button, Color
 from pybricks.tools import wait, StopWatch, DataLog
@@ -14,12 +18,27 @@ from pybricks.ev3devices import (
 from math import tau
 
 
-def run(moves, scale, r, alpha, ev3):
+def run(moves, scale, r, alpha, ev3, cache=None, key=None, commands=None):
+    # commands optionally names a trajectory file from compiler.py to stream
+    # to the motors, moves and the geometry are ignored then
     PAPER_TURNER_PORT = "A"
     PAPER_TURNER_GEARS = [1, 40]
     PEN_TURNER_PORT = "B"
     PEN_TURNER_GEARS = [8, 40]
-    MOVES_PER_SECOND = 5
+    # Limits at the motor shaft in deg/s and deg/s/s
+    PAPER_TURNER_MAX_SPEED = 800
+    PAPER_TURNER_MAX_ACCELERATION = 1600
+    PEN_TURNER_MAX_SPEED = 800
+    PEN_TURNER_MAX_ACCELERATION = 1600
+    SOLVER = "analytic"
+    TELEMETRY = False
+    # Solve while drawing instead of solving everything up front
+    PIPELINED = True
+    QUEUE_DEPTH = 32
+    # Round moves to whole encoder counts and skip the ones that round to 0
+    QUANTIZE = True
+    # Drive to absolute encoder targets and return to the start pose when done
+    CLOSED_LOOP = True
 
     paper_turner = Motor(
         PAPER_TURNER_PORT,
@@ -30,31 +49,170 @@ def run(moves, scale, r, alpha, ev3):
         PEN_TURNER_PORT, positive_direction=Direction.CLOCKWISE, gears=PEN_TURNER_GEARS
     )
 
-    calculator = Calculator(r, alpha)
+    # Make the motors accelerate the way the scheduler expects them to
+    for motor, gears, speed, acceleration in (
+        (
+            paper_turner,
+            PAPER_TURNER_GEARS,
+            PAPER_TURNER_MAX_SPEED,
+            PAPER_TURNER_MAX_ACCELERATION,
+        ),
+        (
+            pen_turner,
+            PEN_TURNER_GEARS,
+            PEN_TURNER_MAX_SPEED,
+            PEN_TURNER_MAX_ACCELERATION,
+        ),
+    ):
+        ratio = gear_ratio(gears)
+        motor.control.limits(
+            speed / ratio, acceleration / ratio, motor.control.limits()[2]
+        )
+    scheduler = Scheduler(
+        PEN_TURNER_GEARS,
+        PAPER_TURNER_GEARS,
+        (PEN_TURNER_MAX_SPEED, PAPER_TURNER_MAX_SPEED),
+        (PEN_TURNER_MAX_ACCELERATION, PAPER_TURNER_MAX_ACCELERATION),
+    )
+    quantizer = Quantizer(PEN_TURNER_GEARS, PAPER_TURNER_GEARS) if QUANTIZE else None
+
+    telemetry = Telemetry() if TELEMETRY else None
+    if commands is None:
+        calculator = Calculator(r, alpha, solver=SOLVER, telemetry=telemetry)
+
+    def solutions(record=None):
+        for move in moves:
+            d_alpha, d_beta = calculator.move(move[0] * scale, move[1] * scale)
+            d_alpha, d_beta = d_alpha * 360 / tau, d_beta * 360 / tau
+            if record is not None:
+                record.append(d_alpha, d_beta)
+            yield d_alpha, d_beta
+
+        if telemetry is not None:
+            print(telemetry.report())
+
+    def solve():
+        angle_changes = Pairs()
+        angle_changes.extend(solutions())
+        return angle_changes
+
+    angle_changes = record = None
+    if commands is not None:
+        trajectory = Trajectory(commands)
+        ratios = (gear_ratio(PEN_TURNER_GEARS), gear_ratio(PAPER_TURNER_GEARS))
+        problem = None
+        if any(abs(a - b) > 1e-6 * b for a, b in zip(trajectory.ratios, ratios)):
+            problem = "Compiled for other gears"
+        elif not trajectory.verify():
+            problem = "Trajectory damaged"
+        if problem is not None:
+            trajectory.close()
+            ev3.display.text(problem)
+            wait(2000)
+            return
+        quantizer = None  # Compiled moves are whole counts already
+    elif cache is not None and key is not None:
+        key = f"angles {key} {scale} {r} {alpha} {SOLVER}"
+        angle_changes = cache.load(key)
+        if angle_changes is None and not PIPELINED:
+            angle_changes = solve()
+            cache.store(key, angle_changes)
+        elif angle_changes is None:
+            # Collected while drawing and cached once done
+            record = Pairs()
+    elif not PIPELINED:
+        angle_changes = solve()
+
+    if commands is not None:
+        pipeline = Pipeline(trajectory.records(), QUEUE_DEPTH)
+        total = len(trajectory)
+    elif angle_changes is None:
+        pipeline = Pipeline(solutions(record), QUEUE_DEPTH)
+        total = None
+    else:
+        pipeline = Pipeline(angle_changes, QUEUE_DEPTH)
+        total = len(angle_changes)
 
-    angle_changes = []
+    pen_turner.reset_angle(0)
+    paper_turner.reset_angle(0)
+    target = [0, 0]  # Absolute joint targets, relative to the start pose
 
-    for move in moves:
-        d_alpha, d_beta = calculator.move(move[0] * scale, move[1] * scale)
-        angle_changes.append((d_alpha * 360 / tau, d_beta * 360 / tau))
+    def start(d_alpha, d_beta, schedule=None):
+        # Starts both motors on a move and returns its duration in ms, the
+        # (speed_alpha, speed_beta, ms) schedule is worked out here unless
+        # it was compiled ahead
+        if CLOSED_LOOP:
+            target[0] += d_alpha
+            target[1] += d_beta
+            # Aim from where the motors really are, which also makes up for
+            # anything an earlier move didn't finish
+            d_alpha = target[0] - pen_turner.angle()
+            d_beta = target[1] - paper_turner.angle()
+
+        if not schedule:
+            schedule = scheduler.schedule(d_alpha, d_beta)
+        speed_alpha, speed_beta, time = schedule
+        if CLOSED_LOOP:
+            if d_alpha:
+                pen_turner.run_target(
+                    speed_alpha, target[0], then=Stop.HOLD, wait=False
+                )
+            if d_beta:
+                paper_turner.run_target(
+                    speed_beta, target[1], then=Stop.HOLD, wait=False
+                )
+        else:
+            if d_alpha:
+                pen_turner.run_angle(speed_alpha, d_alpha, then=Stop.HOLD, wait=False)
+            if d_beta:
+                paper_turner.run_angle(speed_beta, d_beta, then=Stop.HOLD, wait=False)
+        return time
 
     ev3.light(Color.BLUE)
     ev3.speaker.beep()
 
+    watch = StopWatch()
     i = 0
-    for d_alpha, d_beta in angle_changes:
-        i += 0
-        ev3.display.text(f"{round(i/len(angle_changes)*100)}%")
-        pen_turner.run_angle(
-            d_alpha * MOVES_PER_SECOND * 1.1, d_alpha, then=Stop.HOLD, wait=False
-        )
-        paper_turner.run_angle(
-            d_beta * MOVES_PER_SECOND * 1.1, d_beta, then=Stop.HOLD, wait=False
-        )
-        wait(1000 / MOVES_PER_SECOND)
+    while True:
+        angles = pipeline.pop()
+        if angles is None:
+            break
+        i += 1
+        if quantizer is not None:
+            angles = quantizer.quantize(*angles)
+            if angles is None:
+                continue
+        d_alpha, d_beta = angles[0], angles[1]
+
+        ev3.display.text(f"{round(i/total*100)}%" if total else f"{i}")
+        time = start(d_alpha, d_beta, angles[2:])
+
+        # Solve ahead while the motors are busy
+        deadline = watch.time() + time
+        pipeline.fill(watch.time, deadline)
+        wait(max(0, deadline - watch.time()))
+
+    if record is not None:
+        cache.store(key, record)
+    if commands is not None:
+        trajectory.close()
+    elif calculator.failures:
+        # Moves the solver gave up on were left out of the drawing
+        print(f"{calculator.failures} moves failed to converge")
+        ev3.display.text(f"{calculator.failures} moves failed")
+        wait(2000)
+
+    if CLOSED_LOOP:
+        ev3.display.text(f"Returning home")
+        wait(start(-target[0], -target[1]))
+        # The speed estimate jitters while holding, the controller knows
+        # when the move is really over
+        while not (pen_turner.control.done() and paper_turner.control.done()):
+            wait(10)
 
     ev3.display.text(f"Done.")
     ev3.speaker.beep()
     wait(1000)
-    ev3.display.text(f"Reset pen before starting again")
-    wait(1000)
+    if not CLOSED_LOOP:
+        ev3.display.text(f"Reset pen before starting again")
+        wait(1000)
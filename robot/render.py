@@ -0,0 +1,31 @@
+import argparse
+from functools import partial
+
+from patterns import CURVES, draw_curve
+from virtual import run
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render curves without a window")
+    parser.add_argument("curves", nargs="*", help="Curve names, default all")
+    parser.add_argument(
+        "-o", "--output", default=".", help="Directory for the PNGs and videos"
+    )
+    parser.add_argument("--video", action="store_true", help="Also write an MP4")
+    parser.add_argument(
+        "--frame-every", type=int, default=10, help="Moves per video frame"
+    )
+    parser.add_argument("--fps", type=int, default=30)
+    args = parser.parse_args()
+
+    for curve in args.curves or CURVES:
+        print(f"Rendering {curve}")
+        render = partial(
+            run,
+            headless=True,
+            output=f"{args.output}/{curve.lower()}.png",
+            video=f"{args.output}/{curve.lower()}.mp4" if args.video else None,
+            frame_every=args.frame_every,
+            fps=args.fps,
+        )
+        draw_curve(curve, render)
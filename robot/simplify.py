@@ -0,0 +1,157 @@
+from math import tau, sin, cos, sqrt, ceil
+
+from pairs import Pairs
+from smarts_for_stupids import Calculator, solve, wrap
+
+
+def merge_collinear(moves):
+    # Joins consecutive moves heading the exact same way, holding on to one
+    # move until the next one turns
+    pending = None
+    for dx, dy in moves:
+        if pending is not None:
+            x, y = pending
+            same_line = abs(x * dy - y * dx) <= 1e-9 * (abs(x) + abs(y))
+            if same_line and x * dx + y * dy > 0:
+                pending = (x + dx, y + dy)
+                continue
+            yield pending
+        pending = (dx, dy)
+    if pending is not None:
+        yield pending
+
+
+def distance(point, start, end):
+    # Distance of point to the segment from start to end
+    x, y = point
+    x0, y0 = start
+    dx, dy = end[0] - x0, end[1] - y0
+    length = dx * dx + dy * dy
+    t = 0
+    if length:
+        t = max(0, min(1, ((x - x0) * dx + (y - y0) * dy) / length))
+    x, y = x - x0 - t * dx, y - y0 - t * dy
+    return sqrt(x * x + y * y)
+
+
+def rdp(points, tolerance):
+    # Ramer-Douglas-Peucker on an explicit stack
+    keep = bytearray(len(points))
+    keep[0] = keep[-1] = 1
+
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        worst, index = 0, None
+        for i in range(start + 1, end):
+            d = distance(points[i], points[start], points[end])
+            if d > worst:
+                worst, index = d, i
+        if worst > tolerance:
+            keep[index] = 1
+            stack.append((start, index))
+            stack.append((index, end))
+
+    return [point for point, k in zip(points, keep) if k]
+
+
+def simplify(moves, scale, r, alpha, tolerance=0.5, max_step=tau / 36):
+    # Merges collinear moves, drops points closer than tolerance (in
+    # drawing units) to the simplified path and splits what is left where a
+    # segment turns a joint by more than max_step radians, unless max_step
+    # is None, e.g. when subdivide() runs next anyway. Returns moves in the
+    # same unscaled units as the input.
+    calculator = Calculator(r, alpha)
+    x, y = calculator.target_B.x, calculator.target_B.y
+
+    points = [(x, y)]
+    for dx, dy in merge_collinear(moves):
+        x += dx * scale
+        y += dy * scale
+        points.append((x, y))
+    if len(points) > 2:
+        points = rdp(points, tolerance)
+
+    result = Pairs()
+    elbow = 1 if sin(calculator.alpha) >= 0 else -1
+    angles = solve(calculator.r0, calculator.r, points[0][0], points[0][1], elbow)
+    for (x0, y0), (x1, y1) in zip(points, points[1:]):
+        n = 1
+        if max_step is not None:
+            next_angles = solve(calculator.r0, calculator.r, x1, y1, elbow)
+            turn = max(
+                abs(wrap(next_angles[0] - angles[0])),
+                abs(wrap(next_angles[1] - angles[1])),
+            )
+            angles = next_angles
+            n = max(1, ceil(turn / max_step))
+
+        dx, dy = (x1 - x0) / scale / n, (y1 - y0) / scale / n
+        for _ in range(n):
+            result.append(dx, dy)
+
+    return result
+
+
+def deviation(r0, r, start, end, angles, next_angles):
+    # Furthest the pen gets from the segment from start to end while both
+    # joints turn evenly from angles to next_angles, as the motors do
+    d_alpha = wrap(next_angles[0] - angles[0])
+    d_beta = wrap(next_angles[1] - angles[1])
+    worst = 0
+    for t in (0.25, 0.5, 0.75):
+        alpha = angles[0] + t * d_alpha
+        beta = angles[1] + t * d_beta
+        pen = (
+            r0 * cos(beta) + r * cos(alpha + beta),
+            r0 * sin(beta) + r * sin(alpha + beta),
+        )
+        worst = max(worst, distance(pen, start, end))
+    return worst
+
+
+# Most halvings of one move in subdivide(), a backstop against moves that
+# never get straight enough
+MAX_DEPTH = 16
+
+
+def subdivide(moves, scale, r, alpha, tolerance=0.5):
+    # Merges collinear moves, then halves each move until the pen stays within
+    # tolerance (in drawing units) of the straight line while the joints turn
+    # evenly. Long moves far out get split a few times, short ones not at all.
+    # Pieces with an end out of reach stay whole since the solver clamps them
+    # and no split makes them straight; clip_moves deals with those. Returns
+    # moves one at a time, in the same unscaled units as the input.
+    calculator = Calculator(r, alpha)
+    r0, r = calculator.r0, calculator.r
+    elbow = 1 if sin(calculator.alpha) >= 0 else -1
+    point = (calculator.target_B.x, calculator.target_B.y)
+    angles = (calculator.alpha, calculator.beta)
+    inner, outer = abs(r0 - r), r0 + r
+
+    def reachable(point):
+        return inner <= sqrt(point[0] * point[0] + point[1] * point[1]) <= outer
+
+    for dx, dy in merge_collinear(moves):
+        end = (point[0] + dx * scale, point[1] + dy * scale)
+        end_angles = solve(r0, r, end[0], end[1], elbow)
+
+        # Pieces of the move in order, depth first on an explicit stack
+        stack = [(point, end, angles, end_angles, 0)]
+        while stack:
+            start, stop, start_angles, stop_angles, depth = stack.pop()
+            if (
+                depth < MAX_DEPTH
+                and reachable(start)
+                and reachable(stop)
+                and deviation(r0, r, start, stop, start_angles, stop_angles) > tolerance
+            ):
+                middle = ((start[0] + stop[0]) / 2, (start[1] + stop[1]) / 2)
+                middle_angles = solve(r0, r, middle[0], middle[1], elbow)
+                depth += 1
+                stack.append((middle, stop, middle_angles, stop_angles, depth))
+                stack.append((start, middle, start_angles, middle_angles, depth))
+            else:
+                yield (stop[0] - start[0]) / scale, (stop[1] - start[1]) / scale
+
+        point, angles = end, end_angles
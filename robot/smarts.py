@@ -1,6 +1,7 @@
 import cv2
 import numpy as np
-from math import tau, sin, cos, atan2, sqrt
+from math import tau, sin, cos, atan2, sqrt, acos
+from telemetry import ticks_us, ticks_diff
 
 
 class Vec:
@@ -53,6 +54,104 @@ def vecp(rho, phi):
     return Vec(rho * cos(phi), rho * sin(phi))
 
 
+def wrap(angle):
+    return (angle + tau / 2) % tau - tau / 2
+
+
+def solve(r0, r, x, y, elbow=1):
+    # Pen arm angle from the law of cosines, paper angle from atan2.
+    # Targets out of reach are clamped to the closest reachable point.
+    c = (x * x + y * y - r0 * r0 - r * r) / (2 * r0 * r)
+    alpha = elbow * acos(max(-1, min(1, c)))
+    beta = atan2(y, x) - atan2(r * sin(alpha), r0 + r * cos(alpha))
+    return alpha, beta
+
+
+def solve_moves(moves, scale, r, alpha):
+    # Batch version of the analytic solver, solves a whole move list at once
+    # and returns an Nx2 array of (d_alpha, d_beta) for each move
+    moves = np.asarray(moves, dtype=np.float64).reshape(-1, 2)
+    r0 = 400 / ((1 / r) + 1)
+    r = 400 / (r + 1)
+    alpha = tau / 2 - alpha
+
+    start = np.array([r0 + r * cos(alpha), r * sin(alpha)])
+    targets = start + np.cumsum(moves * scale, axis=0)
+    x, y = targets[:, 0], targets[:, 1]
+
+    elbow = 1 if sin(alpha) >= 0 else -1
+    c = (x * x + y * y - r0 * r0 - r * r) / (2 * r0 * r)
+    alphas = elbow * np.arccos(np.clip(c, -1, 1))
+    betas = np.arctan2(y, x) - np.arctan2(r * np.sin(alphas), r0 + r * np.cos(alphas))
+
+    angles = np.empty((len(moves) + 1, 2))
+    angles[0] = alpha, 0
+    angles[1:, 0] = alphas
+    angles[1:, 1] = betas
+
+    return np.diff(np.unwrap(angles, axis=0), axis=0)
+
+
+def clip_moves(moves, scale, r, alpha, margin=30):
+    # Clips a whole move list against the reachable annulus, r0 - r + margin
+    # to r0 + r - margin around the paper's center. Moves get split where they
+    # cross a boundary and the parts outside are pushed radially onto it.
+    # Returns the clipped moves as an Nx2 array, unscaled like the input, and
+    # the (first, last) indices of the input moves in each clipped span.
+    if not isinstance(moves, np.ndarray):
+        moves = list(moves)
+    moves = np.asarray(moves, dtype=np.float64).reshape(-1, 2)
+    r0 = 400 / ((1 / r) + 1)
+    r = 400 / (r + 1)
+    alpha = tau / 2 - alpha
+    inner, outer = r0 - r + margin, r0 + r - margin
+
+    start = np.array([r0 + r * cos(alpha), r * sin(alpha)])
+    points = np.vstack((start, start + np.cumsum(moves * scale, axis=0)))
+    p, d = points[:-1], points[1:] - points[:-1]
+
+    # Where each segment p + t d crosses either circle, |p + t d| = radius
+    a = np.einsum("ij,ij->i", d, d)
+    b = 2 * np.einsum("ij,ij->i", p, d)
+    c = np.einsum("ij,ij->i", p, p)
+    t = np.full((len(p), 5), np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for i, radius in enumerate((inner, outer)):
+            root = np.sqrt(b * b - 4 * a * (c - radius * radius))
+            t[:, 1 + 2 * i] = (-b - root) / (2 * a)
+            t[:, 2 + 2 * i] = (-b + root) / (2 * a)
+    t[(t <= 0) | (t >= 1)] = np.nan
+    t[:, 0] = 0  # Every segment starts a piece
+    t.sort(axis=1)  # NaNs go last
+    keep = ~np.isnan(t)
+
+    # Pieces of the segments between the crossings, each either all inside or
+    # all outside, so their midpoints tell which input moves get clipped
+    end = np.hstack((t[:, 1:], np.full((len(p), 1), np.nan)))
+    end[keep & np.isnan(end)] = 1
+    middle = p[:, None] + ((t + end) / 2)[:, :, None] * d[:, None]
+    rho = np.hypot(middle[..., 0], middle[..., 1])
+    out = (keep & ((rho < inner) | (rho > outer))).any(axis=1)
+    edges = np.diff(np.concatenate(([0], out.astype(np.int8), [0])))
+    spans = [
+        (int(first), int(last))
+        for first, last in zip(
+            np.nonzero(edges == 1)[0], np.nonzero(edges == -1)[0] - 1
+        )
+    ]
+
+    if not spans:
+        return moves, spans
+
+    pieces = p[:, None] + t[:, :, None] * d[:, None]
+    points = np.vstack((pieces[keep], points[-1]))
+    rho = np.hypot(points[:, 0], points[:, 1])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        points *= np.where(rho > 0, np.clip(rho, inner, outer) / rho, 1)[:, None]
+
+    return np.diff(points, axis=0) / scale, spans
+
+
 def arrow(img, vec1, vec2):
     return cv2.arrowedLine(
         img,
@@ -77,13 +176,29 @@ def line(img, vec1, vec2):
 
 class Calculator:
 
-    def __init__(self, r, alpha, precision=1e-2) -> None:
+    def __init__(
+        self,
+        r,
+        alpha,
+        precision=1e-2,
+        solver="descent",
+        max_iterations=20,
+        telemetry=None,
+        check_reach=True,
+    ) -> None:
         self.r0 = 400 / ((1 / r) + 1)  # Distance of the two centers of rotation
         self.r = 400 / (
             r + 1
         )  # The distance of the two centers of rotation, divided by the pen arm length
         self.alpha = tau / 2 - alpha  # Angle between the pen arm and the paper rotator
         self.precision = precision  # Max numerical step width
+        if solver not in ("descent", "analytic", "newton"):
+            raise ValueError(f"Unknown solver {solver}")
+        self.solver = solver
+        self.max_iterations = max_iterations  # Iteration cap of the newton solver
+        self.telemetry = telemetry  # Optional telemetry.Telemetry to record moves
+        # Skip moves out of reach, not needed for moves from clip_moves
+        self.check_reach = check_reach
 
         self.anchor = vec(50, 50)
         self.w, self.h = 1000, 500
@@ -108,27 +223,108 @@ class Calculator:
             cv2.LINE_AA,
         )
 
+        self.background = self.painting.copy()  # For repainting from scratch
+
+        # Frame buffer reused for every frame, and the rectangles of it that
+        # differ from the painting because the arms or new ink are on them
+        self.buffer = self.painting.copy()
+        self.dirty = []
+
         A = vecp(self.r0, self.beta) + self.anchor
         self.oldB = vecp(self.r, self.alpha + self.beta) + A
 
         self.target_B = self.oldB
         self.d_alpha = 0
         self.d_beta = 0
+        self.iterations = 0
+        self.converged = True
+        self.failures = 0  # Moves the newton solver gave up on
 
-    def draw(self):
+    def arms(self):
+        # Elbow and pen position on the canvas
         A = vecp(self.r0, self.beta) + self.anchor
-        B = vecp(self.r, self.alpha + self.beta) + A
-
-        if self.oldB != B:
-            self.painting = line(self.painting, self.oldB, B)
-            self.oldB = B
+        return A, vecp(self.r, self.alpha + self.beta) + A
+
+    def pen(self):
+        B = self.arms()[1]
+        return B.x, B.y
+
+    def ink(self, points):
+        # Draws a whole stretch of pen positions, ending at the current one,
+        # onto the painting at once
+        if len(points) < 2:
+            return
+        points = np.asarray(points, np.float64).astype(np.int32)
+        self.painting = cv2.polylines(
+            self.painting, [points], False, (127, 127, 127), 1, cv2.LINE_AA
+        )
+        self.oldB = self.arms()[1]
+        x0, y0 = points.min(axis=0)
+        x1, y1 = points.max(axis=0)
+        self.dirty.append(self._rect(x0, y0, x1, y1, 2))
+
+    def _rect(self, x0, y0, x1, y1, pad):
+        # Bounding rectangle grown by pad and clipped to the canvas
+        return (
+            max(0, int(x0) - pad),
+            max(0, int(y0) - pad),
+            min(self.w, int(x1) + pad + 1),
+            min(self.h, int(y1) + pad + 1),
+        )
 
-        img = np.copy(self.painting)
+    def _around(self, vec1, vec2):
+        # Everything arrow() or line() can touch between the two points, the
+        # arrow tip reaches a tenth of the length off the line
+        pad = int((vec2 - vec1).rho / 10) + 4
+        return self._rect(
+            min(vec1.x, vec2.x),
+            min(vec1.y, vec2.y),
+            max(vec1.x, vec2.x),
+            max(vec1.y, vec2.y),
+            pad,
+        )
 
+    def state(self):
+        return self.alpha, self.beta, self.target_B
+
+    def restore(self, state):
+        # Back to a state() from earlier, without touching the painting
+        self.alpha, self.beta, self.target_B = state
+
+    def repaint(self, points):
+        # Replaces the painting by the background with points inked on it
+        self.painting = self.background.copy()
+        self.ink(points)
+        self.oldB = self.arms()[1]
+        self.dirty = [(0, 0, self.w, self.h)]
+
+    def frame(self):
+        # The painting with the arms on top. Only the dirty rectangles get
+        # copied over from the painting, and the returned buffer is reused
+        # by the next call.
+        img = self.buffer
+        for x0, y0, x1, y1 in self.dirty:
+            img[y0:y1, x0:x1] = self.painting[y0:y1, x0:x1]
+
+        A, B = self.arms()
         img = arrow(img, self.anchor, A)
         img = arrow(img, A, B)
+        self.dirty = [self._around(self.anchor, A), self._around(A, B)]
+
+        return img
 
-        cv2.imshow("", img)
+    def trace(self):
+        # Inks the pen's way since the last call
+        B = self.arms()[1]
+
+        if self.oldB != B:
+            self.painting = line(self.painting, self.oldB, B)
+            self.dirty.append(self._around(self.oldB, B))
+            self.oldB = B
+
+    def draw(self):
+        self.trace()
+        cv2.imshow("", self.frame())
 
     def _loss(self):
         aA = vecp(self.r0, self.d_beta + self.beta) + self.anchor
@@ -137,23 +333,64 @@ class Calculator:
         return (aB - self.target_B).rho ** 2
 
     def move(self, dx, dy):
-        if (
-            self.target_B - self.anchor + Vec(dx, dy)
-        ).rho > self.r + self.r0 - self.margin or (
-            self.target_B - self.anchor + Vec(dx, dy)
-        ).rho < self.r0 - self.r + self.margin:
-            return 0, 0
+        target_B = self.target_B + Vec(dx, dy)
+        if self.check_reach:
+            rho = (target_B - self.anchor).rho
+            if (
+                rho > self.r + self.r0 - self.margin
+                or rho < self.r0 - self.r + self.margin
+            ):
+                return 0, 0
+
+        self.target_B = target_B
+
+        telemetry = self.telemetry
+        if telemetry is not None:
+            self.d_alpha = self.d_beta = 0
+            initial_loss = self._loss()
+            start = ticks_us()
+
+        if self.solver == "analytic":
+            self._solve_analytic()
+        elif self.solver == "newton":
+            self._solve_newton()
+        else:
+            self._solve_descent()
+
+        if telemetry is not None:
+            telemetry.record(
+                self.iterations,
+                initial_loss,
+                self._loss(),
+                ticks_diff(ticks_us(), start),
+                self.converged,
+            )
+
+        self.alpha += self.d_alpha
+        self.beta += self.d_beta
+
+        return self.d_alpha, self.d_beta
 
+    def turn(self, dx, dy, d_alpha, d_beta):
+        # Same as move() with the joint changes solved already, by solve_moves
         self.target_B += Vec(dx, dy)
+        self.d_alpha, self.d_beta = d_alpha, d_beta
+        self.alpha += d_alpha
+        self.beta += d_beta
 
+        return d_alpha, d_beta
+
+    def _solve_descent(self):
         p = self.precision
 
         self.d_alpha = self.d_beta = 0
+        iterations = 0  # Counted locally, stored once the loop is done
 
         loss = self._loss()
 
         w = 1e-15
         while loss > p:
+            iterations += 1
             self.d_alpha += w
             m_alpha = (self._loss() - loss) / w
             self.d_alpha -= 0.0000001 * m_alpha + w
@@ -163,7 +400,48 @@ class Calculator:
             self.d_beta -= 0.0000001 * m_beta + w
             loss = self._loss()
 
-        self.alpha += self.d_alpha
-        self.beta += self.d_beta
+        self.iterations = iterations
 
-        return self.d_alpha, self.d_beta
+    def _solve_analytic(self):
+        # Stay on the current elbow side so the arm never flips mid drawing
+        elbow = 1 if sin(self.alpha) >= 0 else -1
+        self.iterations = 1
+        target = self.target_B - self.anchor
+        alpha, beta = solve(self.r0, self.r, target.x, target.y, elbow)
+
+        self.d_alpha = wrap(alpha - self.alpha)
+        self.d_beta = wrap(beta - self.beta)
+
+    def _solve_newton(self):
+        # Gauss-Newton on the pen position with the analytic Jacobian:
+        #   dB/d_alpha = r * (-sin(alpha + beta), cos(alpha + beta))
+        #   dB/d_beta  = dB/d_alpha + r0 * (-sin(beta), cos(beta))
+        p = self.precision
+
+        self.d_alpha = self.d_beta = 0
+        self.converged = False
+
+        for self.iterations in range(1, self.max_iterations + 1):
+            alpha = self.alpha + self.d_alpha
+            beta = self.beta + self.d_beta
+
+            A = vecp(self.r0, beta) + self.anchor
+            error = self.target_B - (vecp(self.r, alpha + beta) + A)
+            if error.x * error.x + error.y * error.y <= p:
+                self.converged = True
+                break
+
+            x, y = error.x, error.y
+            a1, a2 = (-self.r * sin(alpha + beta), self.r * cos(alpha + beta))
+            b1, b2 = (a1 - self.r0 * sin(beta), a2 + self.r0 * cos(beta))
+
+            tmp = a1 * b2 - a2 * b1
+            if tmp == 0:
+                break
+            self.d_alpha += (b2 * x - b1 * y) / tmp
+            self.d_beta += (a1 * y - a2 * x) / tmp
+
+        if not self.converged:
+            # Hold the arm still rather than apply a diverged solution
+            self.d_alpha = self.d_beta = 0
+            self.failures += 1
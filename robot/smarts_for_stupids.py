@@ -1,4 +1,5 @@
-from math import tau, sin, cos, atan2, sqrt
+from math import tau, sin, cos, atan2, sqrt, acos
+from telemetry import ticks_us, ticks_diff
 
 
 class Vec:
@@ -51,15 +52,41 @@ def vecp(rho, phi):
     return Vec(rho * cos(phi), rho * sin(phi))
 
 
+def wrap(angle):
+    return (angle + tau / 2) % tau - tau / 2
+
+
+def solve(r0, r, x, y, elbow=1):
+    # Pen arm angle from the law of cosines, paper angle from atan2.
+    # Targets out of reach are clamped to the closest reachable point.
+    c = (x * x + y * y - r0 * r0 - r * r) / (2 * r0 * r)
+    alpha = elbow * acos(max(-1, min(1, c)))
+    beta = atan2(y, x) - atan2(r * sin(alpha), r0 + r * cos(alpha))
+    return alpha, beta
+
+
 class Calculator:
 
-    def __init__(self, r, alpha, precision=1e-2) -> None:
+    def __init__(
+        self,
+        r,
+        alpha,
+        precision=1e-2,
+        solver="descent",
+        max_iterations=20,
+        telemetry=None,
+    ) -> None:
         self.r0 = 400 / ((1 / r) + 1)  # Distance of the two centers of rotation
         self.r = 400 / (
             r + 1
         )  # The distance of the two centers of rotation, divided by the pen arm length
         self.alpha = tau / 2 - alpha  # Angle between the pen arm and the paper rotator
         self.precision = precision  # Max numerical step width
+        if solver not in ("descent", "analytic", "newton"):
+            raise ValueError(f"Unknown solver {solver}")
+        self.solver = solver
+        self.max_iterations = max_iterations  # Iteration cap of the newton solver
+        self.telemetry = telemetry  # Optional telemetry.Telemetry to record moves
 
         self.beta = 0
 
@@ -68,6 +95,9 @@ class Calculator:
         self.target_B = vecp(self.r, self.alpha + self.beta) + A
         self.d_alpha = 0
         self.d_beta = 0
+        self.iterations = 0
+        self.converged = True
+        self.failures = 0  # Moves the newton solver gave up on
 
     def _loss(self):
         aA = vecp(self.r0, self.d_beta + self.beta)
@@ -78,14 +108,44 @@ class Calculator:
     def move(self, dx, dy):
         self.target_B += Vec(dx, dy)
 
+        telemetry = self.telemetry
+        if telemetry is not None:
+            self.d_alpha = self.d_beta = 0
+            initial_loss = self._loss()
+            start = ticks_us()
+
+        if self.solver == "analytic":
+            self._solve_analytic()
+        elif self.solver == "newton":
+            self._solve_newton()
+        else:
+            self._solve_descent()
+
+        if telemetry is not None:
+            telemetry.record(
+                self.iterations,
+                initial_loss,
+                self._loss(),
+                ticks_diff(ticks_us(), start),
+                self.converged,
+            )
+
+        self.alpha += self.d_alpha
+        self.beta += self.d_beta
+
+        return self.d_alpha, self.d_beta
+
+    def _solve_descent(self):
         p = self.precision
 
         self.d_alpha = self.d_beta = 0
+        iterations = 0  # Counted locally, stored once the loop is done
 
         loss = self._loss()
 
         w = 1e-15
         while loss > p:
+            iterations += 1
             self.d_alpha += w
             m_alpha = (self._loss() - loss) / w
             self.d_alpha -= 0.0000001 * m_alpha + w
@@ -95,7 +155,47 @@ class Calculator:
             self.d_beta -= 0.0000001 * m_beta + w
             loss = self._loss()
 
-        self.alpha += self.d_alpha
-        self.beta += self.d_beta
+        self.iterations = iterations
 
-        return self.d_alpha, self.d_beta
+    def _solve_analytic(self):
+        # Stay on the current elbow side so the arm never flips mid drawing
+        elbow = 1 if sin(self.alpha) >= 0 else -1
+        self.iterations = 1
+        alpha, beta = solve(self.r0, self.r, self.target_B.x, self.target_B.y, elbow)
+
+        self.d_alpha = wrap(alpha - self.alpha)
+        self.d_beta = wrap(beta - self.beta)
+
+    def _solve_newton(self):
+        # Gauss-Newton on the pen position with the analytic Jacobian:
+        #   dB/d_alpha = r * (-sin(alpha + beta), cos(alpha + beta))
+        #   dB/d_beta  = dB/d_alpha + r0 * (-sin(beta), cos(beta))
+        p = self.precision
+
+        self.d_alpha = self.d_beta = 0
+        self.converged = False
+
+        for self.iterations in range(1, self.max_iterations + 1):
+            alpha = self.alpha + self.d_alpha
+            beta = self.beta + self.d_beta
+
+            A = vecp(self.r0, beta)
+            error = self.target_B - (vecp(self.r, alpha + beta) + A)
+            if error.x * error.x + error.y * error.y <= p:
+                self.converged = True
+                break
+
+            x, y = error.x, error.y
+            a1, a2 = (-self.r * sin(alpha + beta), self.r * cos(alpha + beta))
+            b1, b2 = (a1 - self.r0 * sin(beta), a2 + self.r0 * cos(beta))
+
+            tmp = a1 * b2 - a2 * b1
+            if tmp == 0:
+                break
+            self.d_alpha += (b2 * x - b1 * y) / tmp
+            self.d_beta += (a1 * y - a2 * x) / tmp
+
+        if not self.converged:
+            # Hold the arm still rather than apply a diverged solution
+            self.d_alpha = self.d_beta = 0
+            self.failures += 1
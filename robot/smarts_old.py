@@ -53,6 +53,28 @@ def vecp(rho, phi):
     return Vec(rho * cos(phi), rho * sin(phi))
 
 
+# Dormand-Prince 5(4) tableau: stage weights, then the 5th and 4th order weights
+DOPRI_A = (
+    (),
+    (1 / 5,),
+    (3 / 40, 9 / 40),
+    (44 / 45, -56 / 15, 32 / 9),
+    (19372 / 6561, -25360 / 2187, 64448 / 6561, -212 / 729),
+    (9017 / 3168, -355 / 33, 46732 / 5247, 49 / 176, -5103 / 18656),
+    (35 / 384, 0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84),
+)
+DOPRI_B5 = (35 / 384, 0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84, 0)
+DOPRI_B4 = (
+    5179 / 57600,
+    0,
+    7571 / 16695,
+    393 / 640,
+    -92097 / 339200,
+    187 / 2100,
+    1 / 40,
+)
+
+
 def arrow(img, vec1, vec2):
     return cv2.arrowedLine(
         img,
@@ -77,13 +99,21 @@ def line(img, vec1, vec2):
 
 class Calculator:
 
-    def __init__(self, r, alpha, precision=0.0000001) -> None:
+    def __init__(
+        self, r, alpha, precision=0.0000001, solver="nanomove", tolerance=1e-3
+    ) -> None:
         self.r0 = 400 / ((1 / r) + 1)  # Distance of the two centers of rotation
         self.r = 400 / (
             r + 1
         )  # The distance of the two centers of rotation, divided by the pen arm length
         self.alpha = tau / 2 - alpha  # Angle between the pen arm and the paper rotator
         self.precision = precision  # Max numerical step width
+        if solver not in ("nanomove", "rk45"):
+            raise ValueError(f"Unknown solver {solver}")
+        self.solver = solver
+        self.tolerance = tolerance  # Max pen error per move of rk45, drawing units
+        self.step = 1  # Last step length rk45 took, to start the next move with
+        self.iterations = 0
 
         self.anchor = vec(50, 50)
         self.w, self.h = 1000, 500
@@ -126,25 +156,75 @@ class Calculator:
 
         cv2.imshow("", img)
 
-    def _nanomove(self, v):
-        v = v.copy()
-
-        A = vecp(self.r0, self.beta) + self.anchor
-        B = vecp(self.r, self.alpha) + A
-
-        x, y = v.x, v.y
-        a1, a2 = (-sin(self.alpha), cos(self.alpha))
-        b1, b2 = (-sin(self.beta), cos(self.beta))
+    def _velocity(self, alpha, beta, ux, uy):
+        # Joint speeds that move the pen by (ux, uy) per unit of time. The pen
+        # moves by r e'(alpha) d_alpha + r0 e'(beta) d_beta, solved with
+        # Cramer's rule, which blows up where both arms line up.
+        a1, a2 = (-sin(alpha), cos(alpha))
+        b1, b2 = (-sin(beta), cos(beta))
 
         tmp = a1 * b2 - a2 * b1
-        a = (b2 * x - b1 * y) / tmp
-        b = (a1 * y - a2 * x) / tmp
-        self.alpha += a * self.r0
-        self.beta += b * self.r
+        a = (b2 * ux - b1 * uy) / tmp
+        b = (a1 * uy - a2 * ux) / tmp
+        return a / self.r, b / self.r0
 
-        return vec(a * self.r0, b * self.r)
+    def _nanomove(self, v):
+        d_alpha, d_beta = self._velocity(self.alpha, self.beta, v.x, v.y)
+        self.alpha += d_alpha
+        self.beta += d_beta
+
+        return vec(d_alpha, d_beta)
+
+    def _integrate(self, dx, dy):
+        # Integrates the joint speeds along the move with adaptive
+        # Dormand-Prince steps. Steps grow where the arms are far from lined
+        # up and shrink near it, each keeping its pen error under its share
+        # of tolerance.
+        length = sqrt(dx * dx + dy * dy)
+        self.iterations = 0
+        if not length:
+            return 0, 0
+        ux, uy = dx / length, dy / length
+
+        alpha, beta = self.alpha, self.beta
+        done = 0
+        h = self.step
+        while done < length:
+            h = min(h, length - done)
+            k = []
+            for weights in DOPRI_A:
+                k.append(
+                    self._velocity(
+                        alpha + h * sum(w * k_a for w, (k_a, _) in zip(weights, k)),
+                        beta + h * sum(w * k_b for w, (_, k_b) in zip(weights, k)),
+                        ux,
+                        uy,
+                    )
+                )
+            d_alpha = h * sum(w * k_a for w, (k_a, _) in zip(DOPRI_B5, k))
+            d_beta = h * sum(w * k_b for w, (_, k_b) in zip(DOPRI_B5, k))
+            error_alpha = d_alpha - h * sum(w * k_a for w, (k_a, _) in zip(DOPRI_B4, k))
+            error_beta = d_beta - h * sum(w * k_b for w, (_, k_b) in zip(DOPRI_B4, k))
+            self.iterations += 1
+
+            # Pen error of the step, against the share of tolerance it may use
+            error = self.r * abs(error_alpha) + self.r0 * abs(error_beta)
+            allowed = self.tolerance * h / length
+            if error <= allowed or h <= length * 1e-9:
+                alpha += d_alpha
+                beta += d_beta
+                done += h
+            h *= min(5, max(0.2, 0.9 * (allowed / error) ** 0.25)) if error else 5
+
+        self.step = h
+        d_alpha, d_beta = alpha - self.alpha, beta - self.beta
+        self.alpha, self.beta = alpha, beta
+        return d_alpha, d_beta
 
     def move(self, dx, dy):
+        if self.solver == "rk45":
+            return self._integrate(dx, dy)
+
         d_angles = vec(0, 0)
 
         v = vec(dx, dy)
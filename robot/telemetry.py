@@ -0,0 +1,72 @@
+from array import array
+
+try:
+    from time import ticks_us, ticks_diff
+except ImportError:
+    from time import perf_counter
+
+    def ticks_us():
+        return int(perf_counter() * 1000000)
+
+    def ticks_diff(end, start):
+        return end - start
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[int(p * (len(values) - 1) + 0.5)]
+
+
+class Telemetry:
+    # Per move convergence data of a Calculator, pass one in as
+    # Calculator(..., telemetry=Telemetry()) to switch recording on
+
+    def __init__(self) -> None:
+        self.iterations = array("I")
+        self.initial_loss = array("f")
+        self.final_loss = array("f")
+        self.time = array("I")  # Microseconds
+        self.failed = array("I")  # Moves the solver gave up on
+
+    def __len__(self):
+        return len(self.time)
+
+    def record(self, iterations, initial_loss, final_loss, time, converged=True):
+        if not converged:
+            self.failed.append(len(self))
+        self.iterations.append(iterations)
+        self.initial_loss.append(initial_loss)
+        self.final_loss.append(final_loss)
+        self.time.append(time)
+
+    def stats(self):
+        # name: (p50, p95, max)
+        result = {}
+        for name in ("iterations", "initial_loss", "final_loss", "time"):
+            values = getattr(self, name)
+            if values:
+                result[name] = (
+                    percentile(values, 0.5),
+                    percentile(values, 0.95),
+                    max(values),
+                )
+        return result
+
+    def slowest(self, count=5):
+        return sorted(range(len(self)), key=lambda i: -self.time[i])[:count]
+
+    def report(self):
+        lines = [f"{len(self)} moves, {sum(self.time) / 1000000:.2f}s"]
+        for name, (p50, p95, top) in self.stats().items():
+            lines.append(f"{name}: p50 {p50:.3g} p95 {p95:.3g} max {top:.3g}")
+        if self.failed:
+            lines.append(
+                f"{len(self.failed)} moves failed to converge, first"
+                f" {', '.join(str(i) for i in self.failed[:5])}"
+            )
+        for i in self.slowest():
+            lines.append(
+                f"move {i}: {self.time[i]}us, {self.iterations[i]} iterations,"
+                f" loss {self.initial_loss[i]:.3g} -> {self.final_loss[i]:.3g}"
+            )
+        return "\n".join(lines)
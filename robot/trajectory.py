@@ -0,0 +1,191 @@
+import struct
+
+try:
+    import mmap
+except ImportError:
+    mmap = None  # MicroPython, reads go through the file instead
+
+# Always Adler-32, files get written on the desktop and checked on the brick,
+# which may not have zlib
+try:
+    from zlib import adler32 as checksum
+except ImportError:
+
+    def checksum(data, value=1):
+        # Continues from value like zlib.adler32 does
+        a, b = value & 0xFFFF, value >> 16
+        for byte in data:
+            a = (a + byte) % 65521
+            b = (b + a) % 65521
+        return (b << 16) | a
+
+
+# Compiled motor commands as physical.run issues them. The header holds the
+# geometry, the gear ratios and a checksum of the records, then the name of
+# the curve. Every record has the same size, so move k sits at a known offset:
+# the joint moves in whole motor encoder counts, both speeds in output deg/s
+# and the duration in ms.
+MAGIC = b"PLTT"
+VERSION = 2
+# magic, version, name length, scale, centers distance, start angle, pen and
+# paper turner gear ratio, record count, Adler-32 of the records
+HEADER = "<4sHHfffffII"
+HEADER_SIZE = struct.calcsize(HEADER)
+RECORD = "<hhfff"
+RECORD_SIZE = struct.calcsize(RECORD)
+CHUNK = 64  # Records read at once when streaming
+
+
+def write(path, name, scale, r, alpha, ratios, records):
+    # records are (d_alpha, d_beta, speed_alpha, speed_beta, ms) with the
+    # joint moves in output degrees of whole motor counts
+    data = bytearray()
+    for d_alpha, d_beta, speed_alpha, speed_beta, time in records:
+        data.extend(
+            struct.pack(
+                RECORD,
+                round(d_alpha * ratios[0]),
+                round(d_beta * ratios[1]),
+                speed_alpha,
+                speed_beta,
+                time,
+            )
+        )
+
+    name = name.encode()
+    with open(path, "wb") as file:
+        file.write(
+            struct.pack(
+                HEADER,
+                MAGIC,
+                VERSION,
+                len(name),
+                scale,
+                r,
+                alpha,
+                ratios[0],
+                ratios[1],
+                len(data) // RECORD_SIZE,
+                checksum(data) & 0xFFFFFFFF,
+            )
+        )
+        file.write(name)
+        file.write(data)
+
+
+class Trajectory:
+    # Reads a trajectory file without loading it: records get streamed in
+    # chunks of CHUNK, or straight from an mmap where there is one, and any
+    # record can be read on its own
+
+    def __init__(self, path) -> None:
+        self.file = open(path, "rb")
+        header = self.file.read(HEADER_SIZE)
+        if len(header) != HEADER_SIZE:
+            self.file.close()
+            raise ValueError("Trajectory file too short")
+        (
+            magic,
+            version,
+            name_size,
+            self.scale,
+            self.r,
+            self.alpha,
+            pen_ratio,
+            paper_ratio,
+            self.count,
+            self.check,
+        ) = struct.unpack(HEADER, header)
+        if magic != MAGIC or version != VERSION:
+            self.file.close()
+            raise ValueError("Not a trajectory file of this version")
+        self.ratios = (pen_ratio, paper_ratio)
+        self.name = self.file.read(name_size).decode()
+        self.offset = HEADER_SIZE + name_size
+
+        self.map = None
+        if mmap is not None:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            if len(self.map) < self.offset + self.count * RECORD_SIZE:
+                self.close()
+                raise ValueError("Trajectory file truncated")
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def _record(self, data, offset):
+        d_alpha, d_beta, speed_alpha, speed_beta, time = struct.unpack_from(
+            RECORD, data, offset
+        )
+        return (
+            d_alpha / self.ratios[0],
+            d_beta / self.ratios[1],
+            speed_alpha,
+            speed_beta,
+            time,
+        )
+
+    def __getitem__(self, k):
+        if k < 0:
+            k += self.count
+        if not 0 <= k < self.count:
+            raise IndexError("Record out of range")
+
+        offset = self.offset + k * RECORD_SIZE
+        if self.map is not None:
+            return self._record(self.map, offset)
+        self.file.seek(offset)
+        data = self.file.read(RECORD_SIZE)
+        if len(data) != RECORD_SIZE:
+            raise ValueError("Trajectory file truncated")
+        return self._record(data, 0)
+
+    def records(self, start=0):
+        # Every record from start on
+        if self.map is not None:
+            for k in range(start, self.count):
+                yield self._record(self.map, self.offset + k * RECORD_SIZE)
+            return
+
+        chunk = bytearray(CHUNK * RECORD_SIZE)
+        k = start
+        while k < self.count:
+            # Seek every chunk, a __getitem__ in between may have moved us
+            self.file.seek(self.offset + k * RECORD_SIZE)
+            size = self.file.readinto(chunk)
+            # Only whole records, what is left of a short read is stale
+            whole = min(size // RECORD_SIZE, self.count - k)
+            if not whole:
+                raise ValueError("Trajectory file truncated")
+            for offset in range(0, whole * RECORD_SIZE, RECORD_SIZE):
+                yield self._record(chunk, offset)
+                k += 1
+
+    def __iter__(self):
+        return self.records()
+
+    def verify(self):
+        # Whether the records match the checksum, read a chunk at a time
+        self.file.seek(self.offset)
+        chunk = bytearray(CHUNK * RECORD_SIZE)
+        left = self.count * RECORD_SIZE
+        value = checksum(b"")
+        while left:
+            size = self.file.readinto(chunk)
+            if not size:
+                return False
+            size = min(size, left)
+            value = checksum(memoryview(chunk)[:size], value)
+            left -= size
+        return value & 0xFFFFFFFF == self.check
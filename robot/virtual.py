@@ -1,14 +1,182 @@
 import cv2
-from smarts import Calculator
+from math import tau
+from time import perf_counter
 
+from smarts import Calculator, clip_moves
+from motion import Scheduler
 
-def run(moves, scale, r, alpha, b=None):
-    calculator = Calculator(r, alpha)
+# Same gears as in physical.run, so playback at speed 1 takes as long as the
+# plotter would with the default motor limits
+PAPER_TURNER_GEARS = [1, 40]
+PEN_TURNER_GEARS = [8, 40]
+# Shortest wall time between two frames, more would just be skipped anyway
+FRAME_TIME = 1 / 60
+SEEK_MOVES = 100
+SPEED = 20  # Times as fast as the plotter
 
-    for move in moves:
-        calculator.move(move[0] * scale, move[1] * scale)
-        calculator.draw()
-        cv2.waitKey(30)
+# Playback keys
+PAUSE = ord(" ")
+BACK = ord("a")
+FORWARD = ord("d")
+FASTER = ord("+")
+SLOWER = ord("-")
+END = ord("q")
 
-    cv2.waitKey()
-    cv2.destroyAllWindows()
+
+def step(calculator, move, scale, angles=None):
+    # Solves a move, or takes its joint changes from angles if given
+    if angles is None:
+        return calculator.move(move[0] * scale, move[1] * scale)
+    return calculator.turn(move[0] * scale, move[1] * scale, *next(angles))
+
+
+def play(calculator, moves, scale, speed=1, angles=None):
+    # Shows the moves in a window, speed times as fast as the plotter would
+    # draw them, or as fast as possible for speed 0. Frames are skipped while
+    # behind, every move still gets inked. Space pauses, a and d seek, + and -
+    # change the speed and q skips to the end. Any key closes it at the end.
+    scheduler = Scheduler(PEN_TURNER_GEARS, PAPER_TURNER_GEARS)
+    moves = iter(moves)
+    if angles is not None:
+        angles = iter(angles)
+    # State after every move so far and the plotter time it is reached at,
+    # so seeking back only needs a repaint
+    history = [(calculator.state(), 0)]
+    points = [calculator.pen()]
+    shown = 0  # Index into history
+    target = 0  # Move to skip ahead to without showing anything
+    finished = paused = False
+    start = last_frame = perf_counter()
+
+    while True:
+        if not paused:
+            if shown + 1 < len(history):
+                shown += 1
+                calculator.restore(history[shown][0])
+                calculator.trace()
+            elif not finished:
+                move = next(moves, None)
+                if move is None:
+                    finished = True
+                else:
+                    d_alpha, d_beta = step(calculator, move, scale, angles)
+                    _, _, time = scheduler.schedule(
+                        d_alpha * 360 / tau, d_beta * 360 / tau
+                    )
+                    history.append((calculator.state(), history[-1][1] + time / 1000))
+                    points.append(calculator.pen())
+                    shown += 1
+                    calculator.trace()
+
+        now = perf_counter()
+        at_end = finished and shown + 1 == len(history)
+        if shown < target and not at_end:
+            # Seeking, playback carries on from wherever that ends
+            if speed:
+                start = now - history[shown][1] / speed
+            continue
+
+        # Waiting for the move to be due listens to the keys too, a key
+        # pressed then gets handled right after this frame
+        key = -1
+        behind = False
+        if speed:
+            # Wall time at which the shown move is due to end
+            due = start + history[shown][1] / speed
+            if due > now:
+                key = cv2.waitKey(max(1, int((due - now) * 1000)))
+                now = perf_counter()
+            behind = now - due > FRAME_TIME
+        if key == -1 and not paused and not at_end:
+            if behind or now - last_frame < FRAME_TIME:
+                continue
+        last_frame = now
+
+        cv2.imshow("", calculator.frame())
+        if key == -1:
+            key = cv2.waitKey(1 if not paused and not at_end else 50)
+        if at_end and key != -1:
+            break
+        if key == PAUSE:
+            paused = not paused
+        elif key == BACK or key == FORWARD:
+            if key == BACK:
+                shown = max(0, shown - SEEK_MOVES)
+                calculator.restore(history[shown][0])
+                calculator.repaint(points[: shown + 1])
+            else:
+                target = shown + SEEK_MOVES
+        elif key == FASTER:
+            speed = speed * 2 if speed else 0
+        elif key == SLOWER:
+            speed = speed / 2 if speed else 1
+        elif key == END:
+            target = float("inf")
+            paused = False
+        else:
+            continue
+        # Carry on from the shown move's plotter time at the current speed,
+        # only after a key so time spent drawing frames isn't lost
+        if speed:
+            start = perf_counter() - history[shown][1] / speed
+
+
+def run(
+    moves,
+    scale,
+    r,
+    alpha,
+    b=None,
+    headless=False,
+    output=None,
+    video=None,
+    frame_every=10,
+    fps=30,
+    speed=SPEED,
+    clip=True,
+    angles=None,
+):
+    # angles optionally holds the joint changes of every move, from
+    # smarts.solve_moves, for moves that are clipped already
+    if clip and angles is None:
+        moves, spans = clip_moves(moves, scale, r, alpha)
+        for first, last in spans:
+            print(f"Moves {first} to {last} are out of reach, clipped")
+    calculator = Calculator(r, alpha, solver="analytic", check_reach=not clip)
+    if angles is not None:
+        angles = iter(angles)
+
+    if not headless:
+        play(calculator, moves, scale, speed, angles)
+
+        if output is not None:
+            cv2.imwrite(output, calculator.painting)
+        cv2.destroyAllWindows()
+        return
+
+    # No window: collect the pen path and ink it in stretches, one per video
+    # frame, or all at once at the end
+    writer = None
+    if video is not None:
+        writer = cv2.VideoWriter(
+            video,
+            cv2.VideoWriter_fourcc(*"mp4v"),
+            fps,
+            (calculator.w, calculator.h),
+        )
+
+    points = [calculator.pen()]
+    for i, move in enumerate(moves):
+        step(calculator, move, scale, angles)
+        points.append(calculator.pen())
+        if writer is not None and i % frame_every == 0:
+            calculator.ink(points)
+            points = points[-1:]
+            writer.write(calculator.frame())
+    calculator.ink(points)
+
+    if writer is not None:
+        writer.write(calculator.frame())
+        writer.release()
+    if output is not None:
+        cv2.imwrite(output, calculator.painting)
@@ -1,19 +1,49 @@
-from patterns import CURVES, draw_curve
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from patterns import CURVES, curve, draw_curve, start_angle
+from smarts import clip_moves, solve_moves
 from virtual import run
 
+# Deeper iterations drawn in the "draw all" mode on top of CURVES
+VARIANTS = [
+    ("HILBERT", (5,)),
+    ("GOSPER", (4,)),
+    ("GREEK", (4,)),
+]
+
+
+def prepare(name, args=None):
+    # Generates, clips and solves a curve, in a worker process
+    moves, scale = curve(name, args)
+    moves, spans = clip_moves(moves, scale, 1, start_angle)
+    return moves, scale, spans, solve_moves(moves, scale, 1, start_angle)
+
+
+def draw_all():
+    # Curves get prepared on every core and drawn in the order they are done
+    jobs = [(name, None) for name in CURVES] + VARIANTS
+    with ProcessPoolExecutor() as executor:
+        futures = {executor.submit(prepare, *job): job for job in jobs}
+        for future in as_completed(futures):
+            name, args = futures[future]
+            moves, scale, spans, angles = future.result()
+            print(f"Selected curve: {name}" + (f" {args}" if args else ""))
+            for first, last in spans:
+                print(f"Moves {first} to {last} are out of reach, clipped")
+            run(moves, scale, 1, start_angle, clip=False, angles=angles)
+
 
-while 1:
-    for i, curve in enumerate(CURVES):
-        print(f"{i}: {curve}")
-    try:
-        i = int(input("Curve number? "))
-    except ValueError:
-        i = -1
-    if i == -1 or i >= len(CURVES) or i < 0:
-        for curve in CURVES:
-            print(f"Selected curve: {curve}")
-            draw_curve(curve, run)
-        continue
-    selected_curve = i
-    print(f"Selected curve: {CURVES[selected_curve]}")
-    draw_curve(CURVES[selected_curve], run)
+if __name__ == "__main__":
+    while 1:
+        for i, name in enumerate(CURVES):
+            print(f"{i}: {name}")
+        try:
+            i = int(input("Curve number? "))
+        except ValueError:
+            i = -1
+        if i == -1 or i >= len(CURVES) or i < 0:
+            draw_all()
+            continue
+        selected_curve = i
+        print(f"Selected curve: {CURVES[selected_curve]}")
+        draw_curve(CURVES[selected_curve], run)